@@ -0,0 +1,219 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''Benchmarks of the MCMC hot paths.
+
+Times single calls of graph_change, calculate_bridges, calculate_q, theta_func, MH, max_shortest_path
+and graph_count on synthetic node sets of several sizes and edge densities, full mc_chain_generator
+runs with both engines, and main's worker pool with 1..cpu_count workers. Results are printed and
+saved as JSON so that two commits can be compared:
+
+    python benchmarks/bench_mcmc.py --output before.json
+    git checkout other-commit
+    python benchmarks/bench_mcmc.py --output after.json --compare before.json
+
+The density of a synthetic graph is the fraction of all vertex pairs that are edges on top of a random
+spanning tree; density 0 is a tree.
+'''
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+sys.path.insert(0,os.path.join(os.path.dirname(os.path.abspath(__file__)),'..'))
+import networkx as nx
+import numpy as np
+from mcmc import mcmc
+from mcmc.rng import spawn_seeds
+
+
+def synthetic_chain(n,seed=0):
+    '''MarkovChain over n random nodes in a 100 x 100 square'''
+    rng=np.random.RandomState(seed)
+    m=mcmc.MarkovChain()
+    m.set_nodes([tuple(p) for p in (100*rng.random_sample((n,2))).round(3).tolist()])
+    return(m)
+
+
+def synthetic_graph(m,density,seed=0):
+    '''Connected graph on the nodes of m: a random spanning tree plus density*N(N-1)/2 random extra edges'''
+    rng=random.Random(seed)
+    n=len(m.M)
+    G=nx.Graph()
+    G.add_nodes_from(m.M)
+    for i in range(1,n):
+        j=rng.randrange(i)
+        G.add_edge(m.M[i],m.M[j],weight=m.D[i,j])
+    extra=int(density*n*(n-1)/2)
+    while extra>0 and G.number_of_edges()<n*(n-1)/2:
+        i,j=rng.sample(range(n),2)
+        if not G.has_edge(m.M[i],m.M[j]):
+            G.add_edge(m.M[i],m.M[j],weight=m.D[i,j])
+            extra-=1
+    return(G)
+
+
+def time_call(fn,min_time=0.2,max_calls=10000):
+    '''Mean seconds per call of fn, calling it until min_time has passed'''
+    calls=0
+    start=time.perf_counter()
+    while True:
+        fn()
+        calls+=1
+        elapsed=time.perf_counter()-start
+        if elapsed>=min_time or calls>=max_calls:
+            return(elapsed/calls)
+
+
+def bench_functions(n,density,min_time):
+    '''Seconds per call of the hot path functions on one synthetic graph'''
+    m=synthetic_chain(n)
+    m.rng=None
+    G1=synthetic_graph(m,density)
+    idx=m.node_index
+    i,j=next((idx[u],idx[v]) for u in m.M for v in m.M if u!=v and not G1.has_edge(u,v))#a pair that is not an edge
+    G2=m.graph_change(i,j,G1)
+    uniques={}
+    funcs=[('graph_change',lambda:m.graph_change(i,j,G1)),
+           ('calculate_bridges',lambda:m.calculate_bridges(G1)),
+           ('calculate_q',lambda:m.calculate_q(G1)),
+           ('theta_func',lambda:m.theta_func(G1)),
+           ('MH',lambda:m.MH(G1,G2)),
+           ('max_shortest_path',lambda:m.max_shortest_path(G1)),
+           ('graph_count',lambda:m.graph_count(G1,uniques))]
+    results=[]
+    for name,fn in funcs:
+        sec=time_call(fn,min_time)
+        results.append({'bench':name,'n':n,'density':density,'edges':G1.number_of_edges(),'seconds_per_call':sec})
+        print('{0:>18s}  n={1:<5d} density={2:<5g} edges={3:<7d} {4:12.3f} us/call'.format(name,n,density,G1.number_of_edges(),sec*1e6))
+    return(results)
+
+
+def too_large(m,engine):
+    '''True if main would run the array engine instead of engine on the nodes of m, which the benchmarks then skip.
+    A batched step costs N^3 per chain, so at a few hundred nodes a single round takes minutes'''
+    if engine=='batched' and len(m.M)>m.batched_max_nodes:
+        print('{0:>18s}  n={1:<5d} engine={2:<8s} skipped above batched_max_nodes={3}'.format('',len(m.M),engine,m.batched_max_nodes))
+        return(True)
+    return(False)
+
+
+def bench_chain(n,engine,min_time):
+    '''Iterations per second of mc_chain_generator, counting every chain of the batched engine.
+    None if the engine is skipped at this size'''
+    m=synthetic_chain(n)
+    m.engine=engine
+    if too_large(m,engine):
+        return(None)
+    iterations=max(10,m.batch_chains) if engine=='batched' else 10
+    while True:
+        start=time.perf_counter()
+        m.mc_chain_generator(iterations,seed=1)
+        elapsed=time.perf_counter()-start
+        if elapsed>=min_time:
+            break
+        iterations=int(iterations*max(2,1.2*min_time/max(elapsed,1e-6)))
+    rate=m.task_samples(iterations)/elapsed
+    print('{0:>18s}  n={1:<5d} engine={2:<8s} {3:12.1f} it/s'.format('mc_chain_generator',n,engine,rate))
+    return({'bench':'mc_chain_generator','n':n,'engine':engine,'iterations':iterations,'iterations_per_second':rate})
+
+
+def bench_scaling(n,engine,iterations,workers):
+    '''Iterations per second of the worker pool for every worker count, with iterations split evenly across the workers'''
+    m=synthetic_chain(n)
+    m.engine=engine
+    results=[]
+    if too_large(m,engine):
+        return(results)
+    base=None
+    for w in workers:
+        m.process_num=w
+        m.uniques.clear()
+        start=time.perf_counter()
+        m.run_chains([iterations//w]*w,spawn_seeds(1,w))
+        rate=w*m.task_samples(iterations//w)/(time.perf_counter()-start)
+        base=rate if base is None else base
+        efficiency=rate/(w*base)#1.0 is perfect linear speed-up over one worker
+        results.append({'bench':'pool','n':n,'engine':engine,'workers':w,'iterations':iterations,'iterations_per_second':rate,'efficiency':efficiency})
+        print('{0:>18s}  n={1:<5d} engine={2:<8s} workers={3:<3d} {4:12.1f} it/s  efficiency {5:.2f}'.format('pool',n,engine,w,rate,efficiency))
+    return(results)
+
+
+def entry_id(r):
+    return((r['bench'],r.get('n'),r.get('density'),r.get('engine'),r.get('workers')))
+
+
+def compare(results,baseline_file):
+    '''Print the change of every result against the same entry of an earlier JSON file'''
+    with open(baseline_file) as f:
+        baseline={entry_id(r):r for r in json.load(f)['results']}
+    print('\nChange against {0} (>1 is faster):'.format(baseline_file))
+    for r in results:
+        old=baseline.get(entry_id(r))
+        if old is None:
+            continue
+        if 'seconds_per_call' in r:
+            ratio=old['seconds_per_call']/r['seconds_per_call']
+        else:
+            ratio=r['iterations_per_second']/old['iterations_per_second']
+        flag='  REGRESSION' if ratio<0.9 else ''
+        print('  {0:<60s} {1:6.2f}x{2}'.format(' '.join(str(x) for x in entry_id(r) if x is not None),ratio,flag))
+
+
+def metadata():
+    try:
+        commit=subprocess.check_output(['git','rev-parse','--short','HEAD'],cwd=os.path.dirname(os.path.abspath(__file__)),stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError,subprocess.CalledProcessError):
+        commit=None
+    return({'commit':commit,'python':platform.python_version(),'numpy':np.__version__,'networkx':nx.__version__,
+            'cpu_count':multiprocessing.cpu_count(),'time':time.strftime('%Y-%m-%dT%H:%M:%S')})
+
+
+def main(argv=None):
+    parser=argparse.ArgumentParser(description=__doc__,formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes',default='10,50,200',help='comma separated node counts, up to 2000 (default 10,50,200)')
+    parser.add_argument('--densities',default='0,0.05,0.2',help='comma separated extra edge densities (default 0,0.05,0.2)')
+    sampling=[e for e in mcmc.MarkovChain.engines if e!='exact']#the exact engine runs no chains to time
+    parser.add_argument('--engines',default=','.join(sampling),help='chain engines to run (default {0})'.format(','.join(sampling)))
+    parser.add_argument('--workers',default=None,help='comma separated worker counts for the pool benchmark (default 1..cpu_count)')
+    parser.add_argument('--scaling-size',type=int,default=50,help='node count of the pool benchmark')
+    parser.add_argument('--scaling-iterations',type=int,default=4000,help='total iterations of every pool run')
+    parser.add_argument('--min-time',type=float,default=0.2,help='seconds spent on every timing')
+    parser.add_argument('--output',default='bench_mcmc.json',help='JSON file for the results')
+    parser.add_argument('--compare',default=None,help='JSON file of an earlier run to compare against')
+    args=parser.parse_args(argv)
+    sizes=[int(x) for x in args.sizes.split(',')]
+    densities=[float(x) for x in args.densities.split(',')]
+    engines=args.engines.split(',')
+    if 'exact' in engines:
+        parser.error('the exact engine runs no chains; choose from {0}'.format(','.join(sampling)))
+    if args.workers is None:
+        workers=list(range(1,multiprocessing.cpu_count()+1))
+    else:
+        workers=[int(x) for x in args.workers.split(',')]
+
+    results=[]
+    for n in sizes:
+        for density in densities:
+            results.extend(bench_functions(n,density,args.min_time))
+    for n in sizes:
+        for engine in engines:
+            result=bench_chain(n,engine,args.min_time)
+            if result is not None:
+                results.append(result)
+    for engine in engines:
+        results.extend(bench_scaling(args.scaling_size,engine,args.scaling_iterations,workers))
+
+    with open(args.output,'w') as f:
+        json.dump({'meta':metadata(),'results':results},f,indent=1)
+    print('\nResults written to {0}'.format(args.output))
+    if args.compare:
+        compare(results,args.compare)
+
+
+if __name__=='__main__':
+    main()
@@ -0,0 +1,161 @@
+'''State of the "batched" chain engine of MarkovChain: K independent chains advanced in lockstep in one process.
+The K graphs are stacked in a (K,N,N) adjacency tensor, and proposals, energies, bridges and the
+Metropolis-Hastings test are evaluated for all chains at once with NumPy operations'''
+from collections import Counter
+import numpy as np
+
+
+class BatchedChains(object):
+    '''K chains over the N x N weight matrix W, all starting from the star graph around vertex 0.
+    The shortest paths from vertex 0 are updated by batched Bellman-Ford relaxation and give a shortest path tree;
+    the bridges are the tree edges whose subtree has no other edge leaving it. rng is a numpy Generator'''
+
+    def __init__(self,W,K,r,T,rng):
+        self.W=np.array(W,dtype=float)
+        self.n=n=self.W.shape[0]
+        self.K=K
+        self.r=r
+        self.T=T
+        self.rng=rng
+        self.pairs=n*(n-1)//2
+        self.chains=np.arange(K)
+        I,J=np.triu_indices(n,1)
+        self.bit=np.zeros((n,n),dtype=np.int64)#position of every pair in the graph key, as in edge_key
+        self.bit[I,J]=self.bit[J,I]=np.arange(len(I))
+        self.A=np.zeros((K,n,n),dtype=bool)
+        self.A[:,0,1:]=self.A[:,1:,0]=True
+        self.n_edges=np.full(K,n-1)
+        self.weight=np.full(K,self.W[0].sum())
+        self.dist=np.tile(self.W[0],(K,1))#shortest path lengths from vertex 0
+        self.parent,self.S,self.B=self.tree(self.A,self.dist)
+        self.n_bridges=self.B.sum(axis=(1,2))//2
+        self.theta=self.r*self.weight+self.dist.sum(axis=1)
+        star=0
+        for b in self.bit[0,1:]:
+            star|=1<<int(b)
+        self.keys=[star]*K#graph key of every chain
+        self.step=0
+        self.samples=0#kept samples summed over the chains
+        self.exp_d0=np.zeros(K)
+        self.exp_edgs=np.zeros(K)
+        self.exp_max_path=np.zeros(K)
+        self.unique_graphs=Counter()
+
+    def results(self):
+        '''Sums over all chains, in the same form as ChainState.results'''
+        return(float(self.exp_d0.sum()),float(self.exp_max_path.sum()),float(self.exp_edgs.sum()),self.unique_graphs)
+
+    def draw_pairs(self,prof=None):
+        '''One pair (i,j), i!=j, per chain, uniform over the pairs that are not bridges of that chain'''
+        n,K=self.n,self.K
+        i=self.rng.integers(0,n,K)
+        j=self.rng.integers(0,n-1,K)
+        j+=(j>=i)
+        bad=np.flatnonzero(self.B[self.chains,i,j])
+        while bad.size:#redraw the bridges of the chains that hit one
+            if prof is not None:
+                prof.count('bridge_rejections',bad.size)
+            i[bad]=self.rng.integers(0,n,bad.size)
+            j[bad]=self.rng.integers(0,n-1,bad.size)
+            j[bad]+=(j[bad]>=i[bad])
+            bad=bad[self.B[bad,i[bad],j[bad]]]
+        return(i,j)
+
+    def relax(self,A,dist,chains):
+        '''Bellman-Ford from vertex 0 on the given chains, starting from the upper bounds in dist (updated in place)'''
+        WA=np.where(A[chains],self.W,np.inf)
+        while chains.size:
+            d=dist[chains]
+            nd=np.minimum(d,(d[:,:,None]+WA).min(axis=1))
+            changed=(nd<d).any(axis=1)
+            dist[chains]=nd
+            chains=chains[changed]
+            WA=WA[changed]
+
+    def tree(self,A,dist):
+        '''Shortest path tree of every chain from its exact distances. Returns the parents (K,N), the
+        subtree matrix S (K,N,N) with S[k,v,w] true if v is w or an ancestor of w, and the bridge mask (K,N,N)'''
+        K,n=self.K,self.n
+        parent=(dist[:,:,None]+np.where(A,self.W,np.inf)).argmin(axis=1)#positive weights make the parents acyclic
+        parent[:,0]=0
+        rows=self.chains[:,None]
+        w=np.arange(n)
+        cur=np.tile(w,(K,1))
+        S=np.zeros((K,n,n),dtype=bool)
+        S[rows,cur,w]=True
+        for d in range(n-1):#climb one level per pass until every vertex has reached the root
+            cur=parent[rows,cur]
+            S[rows,cur,w]=True
+            if not cur.any():
+                break
+        tree=np.zeros((K,n,n),dtype=bool)
+        tree[rows,parent,w]=True
+        tree|=tree.transpose(0,2,1)
+        tree[:,0,0]=False
+        other=(A&~tree).astype(np.float32)
+        #out[k,v,w]: number of non tree edges from the subtree of v to w
+        out=np.matmul(S.astype(np.float32),other)
+        leaving=((out>0)&~S).any(axis=2)
+        B=np.zeros((K,n,n),dtype=bool)
+        B[rows,parent[:,1:],w[1:]]=~leaving[:,1:]
+        B|=B.transpose(0,2,1)
+        return(parent,S,B)
+
+    def propose(self,i,j):
+        '''Flip the pair (i[k],j[k]) of every chain k in place. Returns the metrics of the proposed graphs as
+        (added, weight, dist, parent, S, B, n_bridges, theta)'''
+        ks=self.chains
+        added=~self.A[ks,i,j]
+        self.A[ks,i,j]=added
+        self.A[ks,j,i]=added
+        w=self.W[i,j]
+        weight=self.weight+np.where(added,w,-w)
+        dist=self.dist.copy()
+        #an added edge only shortens paths; a removed tree edge lengthens the paths of the subtree below it
+        below_j=self.parent[ks,j]==i
+        cut=~added&(below_j|(self.parent[ks,i]==j))
+        if cut.any():
+            child=np.where(below_j,j,i)[cut]
+            dist[cut]=np.where(self.S[cut,child],np.inf,dist[cut])
+        self.relax(self.A,dist,np.flatnonzero(added|cut))
+        parent,S,B=self.tree(self.A,dist)
+        n_bridges=B.sum(axis=(1,2))//2
+        theta=self.r*weight+dist.sum(axis=1)
+        return(added,weight,dist,parent,S,B,n_bridges,theta)
+
+    def metropolis(self,i,j,proposal,U):
+        '''Metropolis-Hastings test of every chain against the uniforms U. Accepted chains take the
+        proposed state, the others flip their pair back. Returns the mask of accepted chains'''
+        added,weight,dist,parent,S,B,n_bridges,theta=proposal
+        with np.errstate(over='ignore'):
+            f=np.exp(-(theta-self.theta)/self.T)
+        q=(self.pairs-self.n_bridges)/(self.pairs-n_bridges).astype(float)#q2/q1
+        accept=np.minimum(f*q,1)>=U
+        reject=~accept
+        self.A[reject,i[reject],j[reject]]=~added[reject]
+        self.A[reject,j[reject],i[reject]]=~added[reject]
+        self.weight[accept]=weight[accept]
+        self.dist[accept]=dist[accept]
+        self.parent[accept]=parent[accept]
+        self.S[accept]=S[accept]
+        self.B[accept]=B[accept]
+        self.n_bridges[accept]=n_bridges[accept]
+        self.theta[accept]=theta[accept]
+        self.n_edges[accept]+=np.where(added[accept],1,-1)
+        for k in np.flatnonzero(accept):
+            self.keys[k]^=1<<int(self.bit[i[k],j[k]])
+        return(accept)
+
+    def observables(self):
+        '''(K,3) array of the degree of vertex 0, the number of edges and the maximum shortest path of every chain'''
+        return(np.column_stack((self.A[:,0].sum(axis=1),self.n_edges,self.dist.max(axis=1))))
+
+    def record(self):
+        '''Add the current states of all chains to the statistics'''
+        obs=self.observables()
+        self.exp_d0+=obs[:,0]
+        self.exp_edgs+=obs[:,1]
+        self.exp_max_path+=obs[:,2]
+        self.samples+=self.K
+        self.unique_graphs.update(self.keys)
+        return(obs)
@@ -0,0 +1,61 @@
+'''Checkpoints of running chains. Chain k keeps two files in the checkpoint directory:
+chain-<k>.ckpt, a small pickled snapshot of the chain state that is replaced atomically (write then rename), and
+chain-<k>.uniques, an append-only log of the unique graph counts added since the previous checkpoint.
+The snapshot records the length of the log it is consistent with, so a crash at any point loses
+at most the steps taken since the last checkpoint'''
+import os
+import pickle
+from collections import Counter
+
+
+class Checkpointer(object):
+    '''Writes and reads the checkpoint files of one chain'''
+
+    def __init__(self,directory,k):
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.snapshot=os.path.join(directory,'chain-{0}.ckpt'.format(k))
+        self.log=os.path.join(directory,'chain-{0}.uniques'.format(k))
+        self.pending=Counter()#unique graph counts not yet in the log
+
+    def record(self,key):
+        self.pending[key]+=1
+
+    def reset(self):
+        '''Remove the files of a previous run'''
+        for path in (self.snapshot,self.log):
+            if os.path.exists(path):
+                os.remove(path)
+        self.pending.clear()
+
+    def save(self,state):
+        '''Append the pending counts to the log, then atomically replace the snapshot with state (a dict)'''
+        with open(self.log,'ab') as f:
+            if self.pending:
+                pickle.dump(dict(self.pending),f,pickle.HIGHEST_PROTOCOL)
+                f.flush()
+                os.fsync(f.fileno())
+            state['log_offset']=f.tell()
+        tmp=self.snapshot+'.tmp'
+        with open(tmp,'wb') as f:
+            pickle.dump(state,f,pickle.HIGHEST_PROTOCOL)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp,self.snapshot)
+        self.pending.clear()
+
+    def load(self):
+        '''Last saved state with its unique graph counts under 'unique_graphs', or None if there is no checkpoint.
+        Log records written after the snapshot are dropped'''
+        if not os.path.exists(self.snapshot):
+            return(None)
+        with open(self.snapshot,'rb') as f:
+            state=pickle.load(f)
+        uniques=Counter()
+        if os.path.exists(self.log):
+            with open(self.log,'rb+') as f:
+                while f.tell()<state['log_offset']:
+                    uniques.update(pickle.load(f))
+                f.truncate(state['log_offset'])
+        state['unique_graphs']=dict(uniques)
+        return(state)
@@ -1,14 +1,40 @@
 # -*- coding: utf-8 -*-
 
+import sys
 import click
 
+ENGINES=('networkx','array','batched','exact')#same as MarkovChain.engines, repeated so that --help does not import numpy and networkx
+
 
 @click.command()
-def main(args=None):
-    """Console script for mcmc"""
-    click.echo("Replace this message by putting your code into "
-               "mcmc.cli.main")
-    click.echo("See click documentation at http://click.pocoo.org/")
+@click.argument('input_file',required=False,default='./IOFiles/input.txt',type=click.Path(exists=True,dir_okay=False))
+@click.option('-o','--output',type=click.Path(dir_okay=False),help='File for the edge lists of the top 1% graphs.')
+@click.option('-T','--temperature',type=float,help='Temperature T.')
+@click.option('-r',type=float,help='Weight r of the total edge weight in theta.')
+@click.option('-n','--iterations',type=click.IntRange(min=1),help='Number of steps of the simulation.')
+@click.option('-w','--workers',type=click.IntRange(min=1),help='Number of worker processes (process_num).')
+@click.option('--seed',type=int,help='Seed that makes the run reproducible.')
+@click.option('--engine',type=click.Choice(ENGINES),help='Chain engine.')
+@click.option('--profile',is_flag=True,default=None,help='Time the phases of the chain steps and print the profile.')
+@click.option('--profile-file',type=click.Path(dir_okay=False),help='Write the profile to this file instead (implies --profile).')
+def main(input_file,output,temperature,r,iterations,workers,seed,engine,profile,profile_file):
+    """Sample connected graphs over the nodes of INPUT_FILE (default ./IOFiles/input.txt)
+    with Metropolis-Hastings. Options override the values of the input file."""
+    if temperature is not None and temperature<=0:
+        raise click.BadParameter('should be positive',param_hint='-T')
+    overrides={}
+    for name,value in (('o_file',output),('T',temperature),('r',r),('iterations',iterations),('process_num',workers),
+                       ('seed',seed),('engine',engine),('profiling',profile or (True if profile_file else None)),('profile_file',profile_file)):
+        if value is not None:
+            overrides[name]=value
+    from .mcmc import MarkovChain#numpy is only imported once the options are valid, networkx only by the networkx engine
+    m=MarkovChain()
+    m.input_f=input_file
+    m.overrides=overrides
+    try:
+        m.main()
+    except (IOError,ValueError):#the reason has been printed
+        sys.exit(1)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,79 @@
+'''Convergence diagnostics across parallel chains: split Gelman-Rubin R-hat and batch means effective sample size.
+Chains report their observables in batches; only the per-batch count, mean and sum of squared deviations are kept'''
+import numpy as np
+
+
+def merge_moments(a,b):
+    '''Combine (n,mean,M2) of two sets of samples (Chan et al. parallel variance)'''
+    na,ma,Sa=a
+    nb,mb,Sb=b
+    n=na+nb
+    if n==0:
+        return(a)
+    d=mb-ma
+    return(n,ma+d*nb/float(n),Sa+Sb+d*d*na*nb/float(n))
+
+
+class ChainSummary(object):
+    '''Batches of k observables reported by one chain'''
+
+    def __init__(self,k):
+        self.k=k
+        self.batches=[]#(n,mean,M2) of every batch
+
+    def add_batch(self,X):
+        '''Add a batch of samples, an array of shape (n,k)'''
+        X=np.asarray(X,dtype=float).reshape(-1,self.k)
+        mean=X.mean(axis=0)
+        self.batches.append((len(X),mean,((X-mean)**2).sum(axis=0)))
+
+    @property
+    def n(self):
+        return(sum(b[0] for b in self.batches))
+
+    def moments(self,batches=None):
+        '''(n,mean,M2) over the given batches, all batches by default'''
+        total=(0,np.zeros(self.k),np.zeros(self.k))
+        for b in (self.batches if batches is None else batches):
+            total=merge_moments(total,b)
+        return(total)
+
+
+def split_rhat(chains):
+    '''Gelman-Rubin potential scale reduction of every observable. Each chain is split into the first and second
+    half of its batches, so a single chain that is still drifting is detected too. Returns an array of k values;
+    observables that are constant in every chain get 1'''
+    halves=[]
+    for c in chains:
+        h=len(c.batches)//2
+        if h==0:
+            return(np.full(chains[0].k,np.inf))
+        halves.append(c.moments(c.batches[:h]))
+        halves.append(c.moments(c.batches[h:]))
+    n=float(min(h[0] for h in halves))
+    means=np.array([h[1] for h in halves])
+    variances=np.array([h[2]/max(h[0]-1,1) for h in halves])
+    W=variances.mean(axis=0)#within chain variance
+    B=n*means.var(axis=0,ddof=1)#between chain variance
+    var_plus=(n-1)/n*W+B/n
+    with np.errstate(divide='ignore',invalid='ignore'):
+        R=np.sqrt(var_plus/W)
+    R[W==0]=np.where(B[W==0]==0,1.0,np.inf)
+    return(R)
+
+
+def effective_sample_size(chains):
+    '''Effective sample size of every observable, summed over the chains. Each chain uses the batch means
+    estimate n*s^2/(b*var(batch means)), capped at n. Chains with fewer than two batches contribute nothing'''
+    ess=np.zeros(chains[0].k)
+    for c in chains:
+        if len(c.batches)<2:
+            continue
+        n,mean,M2=c.moments()
+        s2=M2/max(n-1,1)
+        b=n/float(len(c.batches))#mean batch size
+        sigma2=b*np.array([m for nb,m,S in c.batches]).var(axis=0,ddof=1)
+        with np.errstate(divide='ignore',invalid='ignore'):
+            e=np.where(sigma2>0,n*s2/sigma2,n)
+        ess+=np.minimum(e,n)
+    return(ess)
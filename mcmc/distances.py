@@ -0,0 +1,94 @@
+'''Pairwise Euclidean distances between the nodes of M, computed once when the input is loaded.
+The edge weight between nodes i and j is D[i,j]'''
+import os
+import tempfile
+from multiprocessing.util import Finalize
+import numpy as np
+
+
+def pair_index(i,j,n):
+    '''Position of the pair (i,j), i!=j, in the row major upper triangle of an n x n matrix'''
+    if i>j:
+        i,j=j,i
+    return(i*n-i*(i+1)//2+(j-i-1))
+
+
+def pairwise_distances(points):
+    '''Dense N x N float64 matrix of the Euclidean distances between the rows of points'''
+    P=np.asarray(points,dtype=float)
+    diff=P[:,None,:]-P[None,:,:]
+    return(np.sqrt((diff**2).sum(axis=2)))
+
+
+def remove_file(path,pid):
+    '''Delete path if this is process pid; forked children inherit the finalizer but not the file'''
+    if os.getpid()==pid and os.path.exists(path):
+        os.remove(path)
+
+
+class CondensedDistances(object):
+    '''Memory bounded distance matrix. Only the N(N-1)/2 entries of the upper triangle are stored,
+    in float32 by default, either in memory or in a memory-mapped file. A memory-mapped matrix
+    pickles as its file name, so every worker process maps the same file instead of holding a copy.
+    The temporary file of memmap is deleted by close, when the matrix is garbage collected or when its process exits'''
+
+    def __init__(self,points,dtype=np.float32,path=None):
+        P=np.asarray(points,dtype=float)
+        self.n=P.shape[0]
+        self.shape=(self.n,self.n)
+        self.dtype=np.dtype(dtype)
+        size=max(self.n*(self.n-1)//2,1)
+        self.path=path
+        if path is None:
+            self.data=np.empty(size,dtype=self.dtype)
+        else:
+            self.data=np.memmap(path,dtype=self.dtype,mode='w+',shape=(size,))
+        k=0
+        for i in range(self.n-1):#one row at a time, so building never needs the dense matrix
+            row=np.sqrt(((P[i+1:]-P[i])**2).sum(axis=1))
+            self.data[k:k+len(row)]=row
+            k+=len(row)
+        if path is not None:
+            self.data.flush()
+            self.data=np.memmap(path,dtype=self.dtype,mode='r',shape=(size,))
+
+    @classmethod
+    def memmap(cls,points,dtype=np.float32,directory=None):
+        '''Condensed matrix backed by a new temporary file'''
+        fd,path=tempfile.mkstemp(suffix='.dist',dir=directory)
+        os.close(fd)
+        D=cls(points,dtype,path)
+        D.finalizer=Finalize(D,remove_file,args=(path,os.getpid()),exitpriority=0)
+        return(D)
+
+    def close(self):
+        '''Delete the temporary file of a matrix made by memmap. The file stays mapped in this process (POSIX),
+        but workers started afterwards can no longer open it'''
+        finalizer=self.__dict__.get('finalizer')
+        if finalizer is not None:
+            finalizer()
+
+    def __getitem__(self,idx):
+        i,j=idx
+        if i==j:
+            return(0.0)
+        return(float(self.data[pair_index(i,j,self.n)]))
+
+    def dense(self):
+        '''Full N x N float64 matrix'''
+        D=np.zeros(self.shape)
+        I,J=np.triu_indices(self.n,1)
+        D[I,J]=D[J,I]=self.data[:len(I)]
+        return(D)
+
+    def __getstate__(self):
+        state=self.__dict__.copy()
+        state.pop('finalizer',None)#the file belongs to the process that made it
+        if self.path is not None:
+            del state['data']
+        return(state)
+
+    def __setstate__(self,state):
+        self.__dict__.update(state)
+        if self.path is not None:
+            self.data=np.memmap(self.path,dtype=self.dtype,mode='r',shape=(max(self.n*(self.n-1)//2,1),))
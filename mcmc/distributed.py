@@ -0,0 +1,173 @@
+'''TCP backend of MarkovChain.main. A Coordinator listens on a TCP address and hands out chain segments,
+(chain number, (iterations, seed)), to the worker processes that connect to it with run_worker, on this or
+other machines. A worker first receives the pickled MarkovChain holding the parameters of the run and then
+returns MarkovChain.chain_task of every segment it is given. The segment of a worker that disconnects, or
+takes longer than the timeout, goes back in the queue for another worker. Each segment is an independent chain
+with its own seed, so a seeded run gives the same results whichever workers end up running the segments.
+A segment that raises is sent back as an error, which the coordinator raises again.
+
+Both sides unpickle what they receive, so every connection is authenticated with an authkey. Without one the
+coordinator only listens on a loopback address and generates a random key for the workers of this machine.
+
+Start a worker with
+    python -m mcmc.distributed host:port authkey
+'''
+import ipaddress
+import os
+import pickle
+import socket
+import sys
+import threading
+import traceback
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client,Listener
+from queue import Empty,Queue
+
+
+def parse_address(text):
+    '''(host, port) of a "host:port" string'''
+    host,port=text.strip().rsplit(':',1)
+    return((host,int(port)))
+
+
+def picklable_exception(e):
+    '''e, or a RuntimeError with its text if e cannot be pickled, to send it to another process'''
+    try:
+        pickle.dumps(e)
+    except Exception:
+        return(RuntimeError(repr(e)))
+    return(e)
+
+
+def is_loopback(host):
+    '''True if host only resolves to this machine (0.0.0.0 and '' listen on every interface)'''
+    try:
+        return(ipaddress.ip_address(socket.gethostbyname(host)).is_loopback)
+    except (OSError,ValueError):
+        return(False)
+
+
+class Coordinator(object):
+    '''Hands out segments to the workers connected to address. The listener is bound as soon as the coordinator
+    is created, with port 0 picking a free port (see self.address). authkey may only be left out on a loopback
+    address; a random key is used then (see self.authkey)'''
+
+    def __init__(self,address,authkey=None,timeout=None):
+        if authkey is None:
+            if not is_loopback(address[0]):
+                print ("The coordinator on {0} is reachable from other machines. Set authkey to a shared secret".format(address[0]))
+                raise ValueError
+            authkey=os.urandom(16).hex().encode()
+        self.authkey=authkey
+        self.listener=Listener(address,authkey=authkey)
+        self.address=self.listener.address
+        self.timeout=timeout#seconds a worker may take for one segment; None waits as long as its connection is open
+        self.pending=Queue()#segments waiting for a worker
+        self.replies=Queue()
+        self.finished=threading.Event()
+        self.lock=threading.Lock()
+        self.reassigned=0#segments handed out again after their worker was lost
+
+    def run(self,setup,tasks):
+        '''Send setup to every worker, hand out the tasks and yield the reply of every task exactly once,
+        in the order they arrive. A reply is chain_task's (chain number, results, profile).
+        The exception of a segment that fails on a worker is raised here'''
+        self.setup=pickle.dumps(setup,pickle.HIGHEST_PROTOCOL)#pickled once, not while the caller merges results
+        todo=set()
+        for task in tasks:
+            todo.add(task[0])
+            self.pending.put(task)
+        accept=threading.Thread(target=self.accept_workers)
+        accept.daemon=True
+        accept.start()
+        try:
+            while todo:
+                kind,reply=self.replies.get()
+                if kind=='error':
+                    k,exc,trace=reply
+                    print ("Segment {0} failed on a worker:\n{1}".format(k,trace))
+                    raise exc
+                if reply[0] in todo:#every chain is merged once
+                    todo.discard(reply[0])
+                    yield reply
+        finally:
+            self.finished.set()
+
+    def close(self):
+        self.finished.set()
+        self.listener.close()
+
+    def accept_workers(self):
+        while not self.finished.is_set():
+            try:
+                conn=self.listener.accept()
+            except (OSError,EOFError,AuthenticationError):#closed listener, or a client that failed the authentication
+                if self.finished.is_set():
+                    return
+                continue
+            t=threading.Thread(target=self.serve,args=(conn,))
+            t.daemon=True
+            t.start()
+
+    def serve(self,conn):
+        '''Feed one worker with segments until all are done or the worker is lost'''
+        try:
+            conn.send_bytes(self.setup)
+            while not self.finished.is_set():
+                try:
+                    task=self.pending.get(timeout=0.1)
+                except Empty:
+                    continue
+                reply=None
+                try:
+                    conn.send(('task',task))
+                    if self.timeout is None or conn.poll(self.timeout):
+                        reply=conn.recv()
+                except (EOFError,OSError):
+                    pass
+                if reply is None:#the worker died or is too slow, its segment goes to another worker
+                    with self.lock:
+                        self.reassigned+=1
+                    self.pending.put(task)
+                    return
+                self.replies.put(reply)
+            conn.send(('stop',None))
+        except (EOFError,OSError):
+            pass
+        finally:
+            conn.close()
+
+
+def run_worker(address,authkey=None):
+    '''Connect to the coordinator at address (host, port) and run the segments it sends until it says stop.
+    A segment that raises is answered with ('error',(chain number, exception, traceback)) instead of
+    ('done',reply). Returns the number of segments run'''
+    if authkey is None:
+        print ("The worker needs the authkey of the coordinator")
+        raise ValueError
+    conn=Client(address,authkey=authkey)
+    done=0
+    try:
+        setup=pickle.loads(conn.recv_bytes())
+        while True:
+            kind,task=conn.recv()
+            if kind!='task':
+                break
+            try:
+                reply=('done',setup.chain_task(task))
+            except Exception as e:
+                reply=('error',(task[0],picklable_exception(e),traceback.format_exc()))
+            conn.send(reply)
+            done+=1
+    except (EOFError,OSError):#the coordinator is gone
+        pass
+    finally:
+        conn.close()
+    return(done)
+
+
+if __name__=='__main__':
+    if len(sys.argv)<3:
+        print ("Usage: python -m mcmc.distributed host:port authkey")
+        sys.exit(1)
+    print ('Segments run: {0}'.format(run_worker(parse_address(sys.argv[1]),sys.argv[2].encode())))
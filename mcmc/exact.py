@@ -0,0 +1,81 @@
+'''Exact engine of MarkovChain for small node sets. Every connected graph over the N nodes is enumerated and
+weighted by exp(-theta/T), the distribution the chains sample, which gives the exact expectations and the most
+likely graphs. The 2^(N(N-1)/2) edge subsets are processed as blocks of edge bitmasks (the graph keys of
+edge_key) with NumPy: N=6 takes milliseconds, N=7 a few seconds and N=8 several minutes'''
+from collections import namedtuple
+import numpy as np
+
+#Exact expectations as in MarkovChain.main, the number of connected graphs and the probabilities of the most
+#likely ones (the top fraction of the connected graphs, at least one) by graph key
+ExactResult=namedtuple('ExactResult',('exp_d0','exp_max_path','exp_edgs','graphs','top'))
+
+
+def connected_graphs(W,r,block=1<<15):
+    '''Yields, for every block of edge bitmasks, the keys, theta, the degree of vertex 0, the number of edges and
+    the maximum shortest path from vertex 0 of the connected graphs among them. W is the N x N weight matrix'''
+    W=np.asarray(W,dtype=float)
+    n=W.shape[0]
+    I,J=np.triu_indices(n,1)
+    pairs=len(I)
+    bit=np.zeros((n,n),dtype=int)#position of every pair in the key, as in edge_key
+    bit[I,J]=bit[J,I]=np.arange(pairs)
+    shifts=np.arange(pairs,dtype=np.int64)
+    for start in range(0,1<<pairs,block):
+        keys=np.arange(start,min(start+block,1<<pairs),dtype=np.int64)
+        bits=((keys[:,None]>>shifts)&1).astype(bool)
+        #WA[u] holds the weights of the edges of u in every graph of the block, inf where there is no edge,
+        #so that relaxing through u reads contiguous rows
+        #(bit[u,u] reads an arbitrary pair, which only adds a zero weight loop)
+        WA=np.array([np.where(bits[:,bit[u]],W[u],np.inf) for u in range(n)])
+        dist=np.full((len(keys),n),np.inf)
+        dist[:,0]=0
+        for d in range(n-1):#Bellman-Ford from vertex 0, relaxing through one vertex at a time in place
+            before=dist.copy()
+            for u in range(n):
+                np.minimum(dist,dist[:,u,None]+WA[u],out=dist)
+            if np.array_equal(dist,before):
+                break
+        connected=np.isfinite(dist).all(axis=1)
+        if not connected.any():
+            continue
+        bits=bits[connected]
+        dist=dist[connected]
+        theta=r*bits.dot(W[I,J])+dist[:,1:].sum(axis=1)
+        yield(keys[connected],theta,bits[:,bit[0,1:]].sum(axis=1),bits.sum(axis=1),dist.max(axis=1))
+
+
+def exact_distribution(W,r,T,top_fraction=0.01,block=1<<15):
+    '''ExactResult of the graphs over the weight matrix W at temperature T. The weights are summed relative to the
+    smallest theta seen so far, so that exp(-theta/T) does not underflow'''
+    pairs=W.shape[0]*(W.shape[0]-1)//2
+    bound=max(1,int(round(top_fraction*(1<<pairs))))+1#more than the top graphs of any number of connected graphs
+    theta_min=None
+    Z=0.0
+    sums=np.zeros(3)
+    graphs=0
+    cand_keys=np.zeros(0,dtype=np.int64)
+    cand_theta=np.zeros(0)
+    for keys,theta,degree,edges,max_path in connected_graphs(W,r,block):
+        low=theta.min()
+        if theta_min is None or low<theta_min:
+            if theta_min is not None:
+                scale=np.exp(-(theta_min-low)/T)
+                Z*=scale
+                sums*=scale
+            theta_min=low
+        w=np.exp(-(theta-theta_min)/T)
+        Z+=w.sum()
+        sums+=(w.dot(degree),w.dot(max_path),w.dot(edges))
+        graphs+=len(keys)
+        cand_keys=np.concatenate((cand_keys,keys))
+        cand_theta=np.concatenate((cand_theta,theta))
+        if len(cand_keys)>2*bound:#keep only the candidates that can still be among the top graphs
+            keep=np.argpartition(cand_theta,bound)[:bound]
+            cand_keys=cand_keys[keep]
+            cand_theta=cand_theta[keep]
+    top=top_fraction*graphs
+    k=1 if top<1 else int(round(top,0))#as many as quantiling writes
+    order=np.argsort(cand_theta,kind='stable')[:k]
+    probs=np.exp(-(cand_theta[order]-theta_min)/T)/Z
+    top=dict(zip(cand_keys[order].tolist(),probs.tolist()))
+    return(ExactResult(sums[0]/Z,sums[1]/Z,sums[2]/Z,graphs,top))
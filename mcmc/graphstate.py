@@ -0,0 +1,368 @@
+'''Array backed graph state used by the "array" chain engine of MarkovChain.
+The graph lives on the node indices 0..N-1 of the node list M, vertex 0 being M[0]'''
+import heapq
+from functools import lru_cache
+import numpy as np
+try:
+    from .distances import pair_index
+except ImportError:#run as a script through mcmc/__init__.py
+    from distances import pair_index
+
+
+def find_bridges(adj):
+    '''Bridges of an undirected graph found in a single depth first search (Tarjan's low-link algorithm), O(V+E).
+    adj maps every node to its neighbours: a dict of neighbours such as nx.Graph.adj or a list indexed by node.
+    Returns the set of bridges as frozensets {u,v}'''
+    nodes=adj.keys() if hasattr(adj,'keys') else range(len(adj))
+    index={}#discovery order of every node
+    low={}#lowest discovery index reachable through the DFS subtree and one back edge
+    bridges=set()
+    for root in nodes:
+        if root in index:
+            continue
+        index[root]=low[root]=len(index)
+        stack=[(root,None,iter(adj[root]))]#iterative DFS so that large graphs do not hit the recursion limit
+        while stack:
+            u,parent,nbrs=stack[-1]
+            for v in nbrs:
+                if v==parent:
+                    continue
+                if v in index:#back edge
+                    low[u]=min(low[u],index[v])
+                else:
+                    index[v]=low[v]=len(index)
+                    stack.append((v,u,iter(adj[v])))
+                    break
+            else:#all neighbours of u are done
+                stack.pop()
+                if parent is not None:
+                    low[parent]=min(low[parent],low[u])
+                    if low[u]>index[parent]:#no back edge from the subtree of u climbs above u
+                        bridges.add(frozenset((parent,u)))
+    return(bridges)
+
+
+def edge_key(pairs,n):
+    '''Canonical key of a graph on n vertices: an int with bit pair_index(i,j,n) set for every edge (i,j)'''
+    key=0
+    for i,j in pairs:
+        key|=1<<pair_index(i,j,n)
+    return(key)
+
+
+@lru_cache(maxsize=8)
+def pair_vertices(n):
+    '''Vertex arrays I,J of the pair indices of a graph on n vertices, made once per n. Shared, so not to be modified'''
+    return(np.triu_indices(n,1))
+
+
+def key_pairs(key,n):
+    '''Inverse of edge_key. Returns the edges of the key as index pairs (i,j), i<j, in bit order.
+    The key is unpacked in one pass over its bytes instead of clearing its bits one at a time'''
+    I,J=pair_vertices(n)
+    pairs=n*(n-1)//2
+    raw=np.frombuffer(key.to_bytes((pairs+7)//8,'little'),dtype=np.uint8)
+    k=np.flatnonzero(np.unpackbits(raw,bitorder='little'))
+    return(list(zip(I[k].tolist(),J[k].tolist())))
+
+
+class MoveSet(object):
+    '''The valid moves of a chain state, i.e. every vertex pair except the bridges, as an indexable set.
+    Pair indices live in an array with the excluded bridges swapped to its tail, so a valid move is drawn
+    uniformly in O(1) and a change of the bridge set costs time proportional to the bridges that changed'''
+
+    def __init__(self,n):
+        I,J=np.triu_indices(n,1)
+        self.I=I.tolist()#pair index -> vertices
+        self.J=J.tolist()
+        self.moves=list(range(len(self.I)))#valid pair indices first, bridges after position size
+        self.pos=list(range(len(self.I)))#position of every pair index in moves
+        self.size=len(self.I)#number of valid moves
+        self.excluded=set()
+
+    def _swap(self,a,b):
+        ka=self.moves[a]
+        kb=self.moves[b]
+        self.moves[a]=kb
+        self.moves[b]=ka
+        self.pos[kb]=a
+        self.pos[ka]=b
+
+    def update(self,bridges):
+        '''Make the given set of pair indices the excluded moves'''
+        for k in self.excluded-bridges:
+            self._swap(self.pos[k],self.size)
+            self.size+=1
+        for k in bridges-self.excluded:
+            self.size-=1
+            self._swap(self.pos[k],self.size)
+        self.excluded=set(bridges)
+
+    def order(self):
+        '''(moves, size): the order of the pair indices, which decides the move a random number picks'''
+        return((list(self.moves),self.size))
+
+    def set_order(self,moves,size):
+        '''Restore an order saved by order(), so that a resumed chain draws the same moves'''
+        self.moves=list(moves)
+        for p,k in enumerate(self.moves):
+            self.pos[k]=p
+        self.size=size
+        self.excluded=set(self.moves[size:])
+
+    def sample(self,u):
+        '''Valid move picked by a uniform random number u in [0,1), as a vertex pair (i,j)'''
+        k=self.moves[int(u*self.size)]
+        return(self.I[k],self.J[k])
+
+
+class StateMetrics(object):
+    '''Metrics of one chain state, computed once and reused for as long as the chain stays in that state'''
+    __slots__=('theta','bridges','q','paths','degree','_max_path')
+
+    def __init__(self,theta,bridges,q,paths,degree):
+        self.theta=theta
+        self.bridges=bridges#set of bridges as frozensets
+        self.q=q#q(m|n) for moves out of this state
+        self.paths=paths#shortest path lengths from vertex 0, in node order
+        self.degree=degree#degree of vertex 0
+        self._max_path=None
+
+    @property
+    def max_path(self):
+        '''Longest of the shortest paths from vertex 0, computed on first use'''
+        if self._max_path is None:
+            self._max_path=np.max(self.paths)
+        return(self._max_path)
+
+
+class ShortestPathTree(object):
+    '''Shortest paths from vertex 0 of an ArrayGraph, updated after every edge flip instead of recomputed.
+    Adding an edge relaxes outwards from its far end. Removing an edge that is not in the tree changes nothing;
+    removing a tree edge only repairs the subtree hanging below it. Both cost time proportional to the
+    vertices whose distance changes. The changes of the last update are journaled so it can be rolled back'''
+
+    def __init__(self,G,source=0):
+        self.G=G
+        self.dist=np.full(G.n,np.inf)#shortest path lengths from source
+        self.dist[source]=0.0
+        self.parent=[-1]*G.n#predecessor of every vertex in the shortest path tree
+        self.children=[set() for i in range(G.n)]
+        self.total=0.0#running sum of the finite entries of dist
+        self.journal=[]#(vertex,old distance,old parent) for every change made by the last update
+        self.journal_total=0.0
+
+    def _begin(self):
+        self.journal=[]
+        self.journal_total=self.total
+
+    def _set(self,v,d,p):
+        old=self.dist[v]
+        self.journal.append((v,old,self.parent[v]))
+        self.total+=d-old if old!=np.inf else d
+        self.dist[v]=d
+        self._set_parent(v,p)
+
+    def _set_parent(self,v,p):
+        if self.parent[v]>=0:
+            self.children[self.parent[v]].discard(v)
+        self.parent[v]=p
+        if p>=0:
+            self.children[p].add(v)
+
+    def insert(self,u,v):
+        '''Update after the edge (u,v) has been added to the graph'''
+        self._begin()
+        w=self.G.W[u,v]
+        if self.dist[u]+w<self.dist[v]:
+            self._relax(v,self.dist[u]+w,u)
+        elif self.dist[v]+w<self.dist[u]:
+            self._relax(u,self.dist[v]+w,v)
+
+    def _relax(self,v,d,p):
+        '''Dijkstra restricted to the vertices that get closer through v'''
+        W=self.G.W
+        adj=self.G.adj
+        self._set(v,d,p)
+        heap=[(d,v)]
+        while heap:
+            d,x=heapq.heappop(heap)
+            if d>self.dist[x]:
+                continue
+            for y in adj[x]:
+                nd=d+W[x,y]
+                if nd<self.dist[y]:
+                    self._set(y,nd,x)
+                    heapq.heappush(heap,(nd,y))
+
+    def delete(self,u,v):
+        '''Update after the edge (u,v) has been removed from the graph. The graph must still be connected'''
+        self._begin()
+        if self.parent[v]==u:
+            c=v
+        elif self.parent[u]==v:
+            c=u
+        else:#not a tree edge, no distance depended on it
+            return
+        W=self.G.W
+        adj=self.G.adj
+        S=set()#subtree below the removed edge; only these distances can change
+        stack=[c]
+        while stack:
+            x=stack.pop()
+            S.add(x)
+            stack.extend(self.children[x])
+        nd={}
+        npar={}
+        heap=[]
+        for x in S:#best way into the subtree from its boundary
+            best=np.inf
+            bp=-1
+            for y in adj[x]:
+                if y not in S and self.dist[y]+W[y,x]<best:
+                    best=self.dist[y]+W[y,x]
+                    bp=y
+            nd[x]=best
+            npar[x]=bp
+            if bp>=0:
+                heap.append((best,x))
+        heapq.heapify(heap)
+        while heap:#Dijkstra inside the subtree
+            d,x=heapq.heappop(heap)
+            if d>nd[x]:
+                continue
+            for y in adj[x]:
+                if y in S and d+W[x,y]<nd[y]:
+                    nd[y]=d+W[x,y]
+                    npar[y]=x
+                    heapq.heappush(heap,(nd[y],y))
+        for x in S:
+            self._set(x,nd[x],npar[x])
+
+    def rollback(self):
+        '''Undo the changes of the last update'''
+        for v,d,p in reversed(self.journal):
+            self.dist[v]=d
+            self._set_parent(v,p)
+        self.total=self.journal_total
+        self.journal=[]
+
+
+class ArrayGraph(object):
+    '''Graph stored as a boolean adjacency matrix together with neighbour sets for traversals.
+    An edge flip is applied in place and the last flip can be undone if the move is rejected,
+    so the chain never has to copy the graph. The total edge weight and the shortest paths from
+    vertex 0 are maintained incrementally, so theta costs no more than the vertices a flip affects'''
+
+    def __init__(self,W):
+        self.W=W#N x N matrix of edge weights
+        self.n=W.shape[0]
+        self.A=np.zeros((self.n,self.n),dtype=bool)#adjacency matrix
+        self.adj=[set() for i in range(self.n)]#neighbour sets, kept in sync with A
+        self.n_edges=0
+        self.key=0#edge_key of the graph, updated by every flip
+        self.weight=0.0#running total edge weight
+        self.tree=ShortestPathTree(self)
+        self.last=None#(i,j,weight before the flip) of the last call to flip, used by undo
+
+    @classmethod
+    def star(cls,W):
+        '''Initial graph of the chain: vertex 0 connected to all other vertices (same as make_init_graph)'''
+        G=cls(W)
+        for i in range(1,G.n):
+            G.flip(0,i)
+        G.last=None
+        return(G)
+
+    def has_edge(self,i,j):
+        return(bool(self.A[i,j]))
+
+    def degree(self,i):
+        return(len(self.adj[i]))
+
+    def number_of_edges(self):
+        return(self.n_edges)
+
+    def edges(self):
+        '''Edges as index pairs (i,j) with i<j'''
+        for i in range(self.n):
+            for j in self.adj[i]:
+                if i<j:
+                    yield (i,j)
+
+    def _toggle(self,i,j):
+        self.key^=1<<pair_index(i,j,self.n)
+        if self.A[i,j]:
+            self.A[i,j]=self.A[j,i]=False
+            self.adj[i].discard(j)
+            self.adj[j].discard(i)
+            self.n_edges-=1
+            self.weight-=self.W[i,j]
+        else:
+            self.A[i,j]=self.A[j,i]=True
+            self.adj[i].add(j)
+            self.adj[j].add(i)
+            self.n_edges+=1
+            self.weight+=self.W[i,j]
+
+    def flip(self,i,j):
+        '''Add the edge (i,j) if it is absent, remove it otherwise'''
+        self.last=(i,j,self.weight)
+        if self.A[i,j]:
+            self._toggle(i,j)
+            self.tree.delete(i,j)
+        else:
+            self._toggle(i,j)
+            self.tree.insert(i,j)
+
+    def undo(self):
+        '''Revert the last flip'''
+        i,j,weight=self.last
+        self._toggle(i,j)
+        self.weight=weight#restored exactly, rejected moves leave no rounding drift
+        self.tree.rollback()
+        self.last=None
+
+    def bridges(self):
+        '''Set of bridges as frozensets {i,j}'''
+        return(find_bridges(self.adj))
+
+    def is_bridge(self,i,j):
+        '''True if (i,j) is an edge whose removal disconnects the graph'''
+        return(frozenset((i,j)) in self.bridges())
+
+    def bridge_count(self):
+        return(len(self.bridges()))
+
+    def size(self):
+        '''Total edge weight'''
+        return(self.weight)
+
+    def shortest_paths(self,source=0):
+        '''Shortest path lengths from source to every vertex. Read from the maintained tree for vertex 0,
+        computed with Dijkstra for any other source'''
+        if source==0:
+            return(self.tree.dist.copy())
+        return(self.dijkstra(source))
+
+    def dijkstra(self,source):
+        '''Dijkstra from source. Returns the array of shortest path lengths to every vertex'''
+        dist=np.full(self.n,np.inf)
+        dist[source]=0.0
+        heap=[(0.0,source)]
+        done=set()
+        while heap:
+            d,u=heapq.heappop(heap)
+            if u in done:
+                continue
+            done.add(u)
+            for v in self.adj[u]:
+                nd=d+self.W[u,v]
+                if nd<dist[v]:
+                    dist[v]=nd
+                    heapq.heappush(heap,(nd,v))
+        return(dist)
+
+    def theta(self,r):
+        '''theta(Xi) as in MarkovChain.theta_func: r times the total weight plus the shortest paths from vertex 0'''
+        return(r*self.weight+self.tree.total)
@@ -1,25 +1,155 @@
 from operator import itemgetter
 from copy import deepcopy
 import math
-import networkx as nx
-import graphviz as gz
 import numpy as np
 import os
 import timeit
+import heapq
+import pickle
+import atexit
+import traceback
 import multiprocessing
-import random
-from collections import Counter
+from collections import Counter,namedtuple
+from queue import Empty
 #from joblib import Parallel, delayed #For parallelization
-from multiprocessing import Pool,Value
+from multiprocessing import Pool,Value,shared_memory
+try:#imported as part of the mcmc package
+    from .graphstate import ArrayGraph,MoveSet,StateMetrics,edge_key,find_bridges,key_pairs
+    from .distances import CondensedDistances,pair_index,pairwise_distances
+    from .rng import ChainRNG,spawn_seeds
+    from .convergence import ChainSummary,effective_sample_size,split_rhat
+    from .checkpoint import Checkpointer
+    from .profiling import PhaseProfile
+    from .batched import BatchedChains
+    from .distributed import Coordinator,parse_address,picklable_exception,run_worker
+    from .sketch import SpaceSaving
+    from .tracefile import TraceWriter
+    from .exact import exact_distribution
+    from .spill import SpillingCounter
+except ImportError:#run as a script through mcmc/__init__.py
+    from graphstate import ArrayGraph,MoveSet,StateMetrics,edge_key,find_bridges,key_pairs
+    from distances import CondensedDistances,pair_index,pairwise_distances
+    from rng import ChainRNG,spawn_seeds
+    from convergence import ChainSummary,effective_sample_size,split_rhat
+    from checkpoint import Checkpointer
+    from profiling import PhaseProfile
+    from batched import BatchedChains
+    from distributed import Coordinator,parse_address,picklable_exception,run_worker
+    from sketch import SpaceSaving
+    from tracefile import TraceWriter
+    from exact import exact_distribution
+    from spill import SpillingCounter
+
+nx=None#networkx, imported by load_networkx when a graph of the networkx engine is first needed
+
+
+def load_networkx():
+    '''Import networkx on first use, so that the array, batched and exact engines never load it'''
+    global nx
+    if nx is None:
+        import networkx
+        nx=networkx
+    return(nx)
+
+
+class ChainState(object):
+    '''A chain between calls to MarkovChain.advance: the current graph with its cached metrics and valid moves,
+    the random stream, the number of steps taken and the statistics of the samples kept so far'''
+    def __init__(self,G,m1,moves,rng):
+        self.G=G
+        self.m1=m1
+        self.moves=moves
+        self.rng=rng
+        self.step=0
+        self.samples=0#number of kept samples
+        self.exp_d0=0
+        self.exp_edgs=0
+        self.exp_max_path=0
+        self.unique_graphs={}
+
+    def results(self):
+        return(self.exp_d0,self.exp_max_path,self.exp_edgs,self.unique_graphs)
+
+
+#Everything a pool worker needs to run chains: node coordinates (N x 2 array), T, r, the other scalar settings
+#as sorted (name, value) pairs, and the distances if they are memory-mapped (they pickle as the file name)
+ChainSpec=namedtuple('ChainSpec',('points','T','r','params','distances'))
+
+_pool_chain=None#MarkovChain of a pool worker process, built once from the ChainSpec of the run
+_pool_shm=None
+_pool_sums=None#(chains,3) view of the shared memory block that receives the sums of every chain
+
+
+def init_pool_worker(spec,sums_name,chains):
+    '''Pool initializer: build the worker's MarkovChain and map the shared block of sums'''
+    global _pool_chain,_pool_shm,_pool_sums
+    _pool_chain=MarkovChain.from_spec(spec)
+    _pool_shm=shared_memory.SharedMemory(name=sums_name)#the pool shares main's resource tracker, main unlinks the block
+    _pool_sums=np.ndarray((chains,3),dtype=np.float64,buffer=_pool_shm.buf)
+
+
+def pool_task(task):
+    '''Run one chain of the pool. Its (exp_d0,exp_max_path,exp_edgs) sums go to row k of the shared block,
+    only the unique graphs and the profile are pickled back'''
+    k,result,profile=_pool_chain.chain_task(task)
+    _pool_sums[k]=result[:3]
+    return(k,result[3],profile)
+
+
 class MarkovChain:
     input_f='./IOFiles/input.txt'#default input file location
     o_file="./IOFiles/output.txt"#default output file location
     test=0
-    G1=nx.Graph()
-    G2=nx.Graph()
+    G1=None#nx.Graph of the networkx engine, made on demand
+    G2=None
     iterations=200#Number of Steps in the simulation
     T=1
     r=1
+    engine='networkx'#Chain engine: 'networkx' copies nx.Graph states, 'array' flips edges of an ArrayGraph in place, 'batched' advances batch_chains chains in lockstep, 'exact' enumerates every connected graph instead of sampling
+    engines=('networkx','array','batched','exact')
+    exact_max_nodes=8#Largest number of nodes the exact engine accepts; the connected graphs of 9 nodes are too many to enumerate
+    exact_graphs=None#Number of connected graphs enumerated by the last exact run
+    batch_chains=16#Chains per worker of the batched engine; each of them takes the worker's iterations, so a worker keeps batch_chains times the samples
+    batched_max_nodes=50#Above this many nodes main runs the array engine instead of batched, whose bridge search costs N^3 per chain and step
+    proposal='rejection'#'rejection' redraws random pairs until one is not a bridge, 'direct' samples the valid moves of a MoveSet
+    proposals=('rejection','direct')
+    burn_in=0#Number of initial steps of every chain excluded from the statistics
+    thin=1#Statistics are collected on every thin-th step after the burn-in
+    convergence=False#Stop the chains early once they have converged, see run_to_convergence
+    rhat_target=1.01#Largest acceptable split R-hat of the observables in a convergence run
+    ess_target=1000#Smallest acceptable effective sample size of the observables in a convergence run
+    max_time=None#Wall-clock budget in seconds of a convergence run
+    report_every=500#Kept samples per batch reported by every chain in a convergence run
+    scheduling='static'#'static' gives every worker an equal share of the iterations, 'dynamic' lets the workers take segment_steps at a time from a shared counter
+    schedulings=('static','dynamic')
+    segment_steps=1000#Steps a worker of a dynamic run takes from the shared counter at a time
+    worker_steps=None#Steps taken by every worker of the last dynamic run
+    backend='pool'#'pool' runs the chains on a local multiprocessing Pool, 'tcp' hands them out to workers connected to a Coordinator
+    backends=('pool','tcp')
+    address=('localhost',6000)#Address the coordinator of the tcp backend listens on
+    authkey=None#Shared secret (bytes) of the coordinator and its workers; required unless the address is a loopback address, where a random key is generated
+    local_workers=0#Workers the tcp backend starts on this machine; others can connect with python -m mcmc.distributed
+    segment_timeout=None#Seconds after which a segment of the tcp backend is handed to another worker; None waits while the worker is connected
+    overrides=None#Attribute values that take precedence over the input file, e.g. from the command line
+    trace_dir=None#Directory for the binary traces of the kept samples, one file per chain; None writes no trace
+    chain_id=0#Number of the chain being generated, which names its trace file
+    sketch_capacity=None#Graphs tracked by the bounded memory SpaceSaving counts of every chain; None counts every unique graph exactly
+    unique_budget=None#Graph keys every exact count keeps in memory before spilling sorted runs to disk; None keeps them all in memory
+    spill_dir=None#Directory of the spilled runs of the unique graph counts; None uses the system temporary directory
+    temperatures=None#Temperature ladder of a replica exchange run, one replica per temperature; None runs independent chains at T
+    swap_every=100#Steps between two rounds of swap attempts of neighbouring replicas
+    swap_rates=None#Fraction of accepted swaps between every pair of neighbouring temperatures of the last replica exchange run
+    checkpoint_dir=None#Directory for the checkpoints of the chains; None disables checkpointing
+    checkpoint_every=5.0#Seconds between the checkpoints of a chain
+    checkpoint_steps=1000#Steps between two looks at the clock of a checkpointed chain
+    resume=False#Continue every chain from its checkpoint in checkpoint_dir
+    profiling=False#Time the phases of the chain loop and count proposals, accepts and rejects
+    profile_file=None#File for the profiling report; printed by main if None
+    profile=None#PhaseProfile of the chains run by this instance while profiling is on
+    seed=None#Seed of the whole run. Every chain gets an independent stream spawned from it; None draws fresh entropy
+    rng=None#ChainRNG of the chain being generated
+    distance_storage='dense'#'dense' N x N float64 matrix, 'condensed' float32 upper triangle, 'memmap' condensed and memory-mapped from a file shared by the workers
+    distance_storages=('dense','condensed','memmap')
     uniques={}#Empty dictionary to keep track of unique graphs and number of times they are observed
     exp_d0=0.0#Expectation of degree of vertex 0
     exp_edgs=0.0#Expectation of number of edges
@@ -28,40 +158,412 @@ class MarkovChain:
     def main(self):
         start_time = timeit.default_timer()
         #Clear G1 and G2 in case they are not empty
-        self.G1.clear()
-        self.G2.clear()
+        for G in (self.G1,self.G2):
+            if G is not None:
+                G.clear()
         self.input_arg(self.input_f)
-        self.make_init_graph()
+        engine=self.engine#the configured engine, restored after the run
+        if self.engine=='batched' and len(self.M)>self.batched_max_nodes:
+            print ('The batched engine is slower than the array engine above {0} nodes, the array engine is used for the {1} nodes'.format(self.batched_max_nodes,len(self.M)))
+            self.engine='array'
+        try:
+            self.simulate(start_time)
+        finally:
+            self.engine=engine
+
+    def simulate(self,start_time):
+        '''Run the chains (or the exact enumeration) with the settings read by main, print the expectations
+        and write the top graphs. The workers get self.engine, which main may have changed for this run only'''
         self.uniques.clear()
         self.exp_d0=0#Expectation of degree of vertex 0
         self.exp_edgs=0
         self.exp_max_path=0
-        print ('Number of processors to be used:  {0:1d}'.format(self.process_num))
-        process_iter=[int(self.iterations/self.process_num) for i in range(self.process_num)]#Number of interations for each processes
+        if self.engine=='exact':
+            print ('The connected graphs over {0:1d} nodes are enumerated exactly'.format(len(self.M)))
+            process_iter=[]
+            seeds=[]
+        elif self.temperatures is not None:
+            print ('Number of replicas (one process each):  {0:1d}'.format(len(self.temperatures)))
+            process_iter=[self.iterations]#only the replica at temperature T is sampled and it takes all the iterations
+            seeds=spawn_seeds(self.seed,len(self.temperatures))
+        else:
+            print ('Number of processors to be used:  {0:1d}'.format(self.process_num))
+            process_iter=[int(self.iterations/self.process_num) for i in range(self.process_num)]#Number of interations for each processes
+            seeds=spawn_seeds(self.seed,self.process_num)#one independent random stream per chain
+        samples=sum(self.task_samples(n) for n in process_iter)#the averages are over the kept samples only
+        if samples==0 and self.engine!='exact':
+            print ("No samples are kept after a burn-in of {0} steps. Increase iterations".format(self.burn_in))
+            raise ValueError
         
-        #Creating the worker pool
-        pool = Pool(processes=self.process_num)   
-        # parallel map
-        results=pool.map(self.mc_chain_generator, process_iter)#this is a list of tuples returned from the parallel operation
-        for i in range(len(results)):
-            self.exp_d0+=results[i][0]
-            self.exp_max_path+=results[i][1]
-            self.exp_edgs+=results[i][2]
-            '''Counter is a subclass of dictionary which adds up numerical values of 
-            common keys while merging two dictionaries'''
-            self.uniques=Counter(self.uniques)+Counter(results[i][3])
+        if self.engine=='batched' and (self.temperatures is not None or self.checkpoint_dir is not None):
+            print ("The batched engine does not support replica exchange or checkpoints. Use the networkx or array engine")
+            raise ValueError
+        if self.scheduling=='dynamic' and (self.engine=='batched' or self.temperatures is not None or self.convergence
+                                           or self.backend!='pool' or self.checkpoint_dir is not None):
+            print ("The dynamic scheduling runs the networkx or array engine on the pool backend, without replica exchange, convergence or checkpoints")
+            raise ValueError
+        if self.backend=='tcp' and (self.temperatures is not None or self.convergence):
+            print ("The tcp backend runs independent chain segments, without replica exchange or convergence. Use the pool backend")
+            raise ValueError
+        if self.unique_budget is not None and self.backend=='tcp':
+            print ("The spilled unique graph counts are local files. Use the pool backend with unique_budget")
+            raise ValueError
+        self.uniques=self.new_uniques()
+        if isinstance(self.uniques,SpillingCounter):#the runs are kept for inspection after main, until the interpreter exits
+            atexit.register(self.uniques.clear)
+        self.profile=PhaseProfile() if self.profiling else None
+        if self.engine=='exact':
+            sums,samples=self.run_exact()
+        elif self.temperatures is not None:
+            sums=self.run_tempering(self.iterations,seeds)
+        elif self.convergence:
+            sums,samples=self.run_to_convergence(process_iter,seeds)
+        elif self.backend=='tcp':
+            sums=self.run_distributed(process_iter,seeds)
+        elif self.scheduling=='dynamic':
+            sums,samples=self.run_dynamic(self.iterations,seeds)
+        else:
+            sums=self.run_chains(process_iter,seeds)
+        if isinstance(self.D,CondensedDistances):#the workers are done with the memory-mapped file
+            self.D.close()
+        for result in sums:#added in chain order so that a seeded run gives the same floats every time
+            self.exp_d0+=result[0]
+            self.exp_max_path+=result[1]
+            self.exp_edgs+=result[2]
         print('test',self.test)
-        self.exp_d0=float(self.exp_d0)/self.iterations
-        self.exp_edgs=float(self.exp_edgs)/self.iterations
-        self.exp_max_path=float(self.exp_max_path)/self.iterations
+        self.exp_d0=float(self.exp_d0)/samples
+        self.exp_edgs=float(self.exp_edgs)/samples
+        self.exp_max_path=float(self.exp_max_path)/samples
         print('The expected number of edges connected to vertex 0 is ',self.exp_d0)
         print('The expected number of edges in the entire graph ',self.exp_edgs)
         print('The expected maximum distance of the shortest path in a graph that connects vertex 0 to another vertex',self.exp_max_path)
-        print('The number of unique graphs ',len(self.uniques))
-        self.quantiling(self.uniques)
+        if isinstance(self.uniques,SpaceSaving):
+            print('The estimated number of unique graphs ',self.uniques.distinct())
+            print('The graph counts overestimate by at most ',self.uniques.error_bound())
+        elif self.engine=='exact':
+            print('The number of connected graphs ',self.exact_graphs)
+        else:
+            print('The number of unique graphs ',len(self.uniques))
+        self.quantiling(self.uniques,self.exact_graphs if self.engine=='exact' else None)
         elapsed = timeit.default_timer() - start_time
         print("The time to execute the code is:",elapsed)
+        if self.profile is not None:
+            self.write_profile(elapsed)
         #return(self.exp_d0,E,avg_path)
+
+    def run_chains(self,process_iter,seeds):
+        '''Run one chain per entry of process_iter on the worker pool and merge their unique graphs into self.uniques.
+        Returns the (exp_d0,exp_max_path,exp_edgs) sums of every chain, in chain order'''
+        #The workers get the ChainSpec once and each task is only (chain number, (iterations, seed));
+        #the sums come back through shared memory, so only the unique graphs are pickled
+        n=len(process_iter)
+        shm=shared_memory.SharedMemory(create=True,size=24*max(n,1))
+        shared=np.ndarray((n,3),dtype=np.float64,buffer=shm.buf)
+        shared[:]=0
+        try:
+            #Creating the worker pool
+            pool = Pool(processes=self.process_num,initializer=init_pool_worker,initargs=(self.spec(),shm.name,n))
+            #Results are folded in as soon as each worker returns, so only the partials still in flight are held in memory
+            for k,uniques,profile in pool.imap_unordered(pool_task, enumerate(zip(process_iter,seeds)), chunksize=1):
+                t=timeit.default_timer()
+                self.uniques.update(uniques)#adds the counts of common keys in place
+                if profile is not None:
+                    self.profile.merge(profile)
+                    self.profile.add('merge',timeit.default_timer()-t)
+            pool.close()
+            pool.join()
+            sums=[tuple(row) for row in shared.tolist()]
+        finally:
+            del shared#the buffer cannot be closed while an array uses it
+            shm.close()
+            shm.unlink()
+        return(sums)
+
+    def run_exact(self):
+        '''Exact expectations over all connected graphs weighted by exp(-theta/T), see mcmc.exact.
+        self.uniques gets the probabilities of the top 1% graphs. Returns the expectations as the sums of a single
+        chain with one sample, like the other runs of main'''
+        if len(self.M)>self.exact_max_nodes:
+            print ("The exact engine enumerates at most {0} nodes, the input has {1}. Use a sampling engine".format(self.exact_max_nodes,len(self.M)))
+            raise ValueError
+        result=exact_distribution(self.dense_distances(),self.r,self.T)
+        self.uniques=result.top
+        self.exact_graphs=result.graphs
+        return([result[:3]],1)
+
+    def run_dynamic(self,iterations,seeds):
+        '''Run one chain per seed, each in its own process, until they have taken exactly iterations steps together.
+        The workers take segment_steps steps at a time from a shared counter and keep their chain between segments,
+        so faster workers run more steps. Merges the unique graphs into self.uniques, sets worker_steps and returns
+        the per chain sums and the number of samples kept'''
+        counter=Value('q',0)#steps handed out so far
+        queue=multiprocessing.Queue()
+        workers=[multiprocessing.Process(target=self.guarded_worker,args=(self.dynamic_worker,queue,k,iterations,seeds[k],counter,queue)) for k in range(len(seeds))]
+        for w in workers:
+            w.start()
+        sums=[None]*len(workers)
+        self.worker_steps=[0]*len(workers)
+        samples=0
+        for i in range(len(workers)):#results are read before joining, a worker only exits once its message is taken
+            kind,k,(result,steps,kept,profile)=self.next_message(queue,workers)
+            sums[k]=result[:3]
+            self.uniques.update(result[3])
+            self.worker_steps[k]=steps
+            samples+=kept
+            if profile is not None:
+                self.profile.merge(profile)
+        for w in workers:
+            w.join()
+        print('Steps taken by each worker: {0}'.format(self.worker_steps))
+        if samples==0:
+            print ("No samples are kept after a burn-in of {0} steps. Increase iterations".format(self.burn_in))
+            raise ValueError
+        return(sums,samples)
+
+    def dynamic_worker(self,k,iterations,seed,counter,queue):
+        '''Chain k of a dynamic run. Takes segments from counter until all iterations are handed out,
+        then sends ('done',k,(results,steps,kept samples,profile))'''
+        self.profile=PhaseProfile() if self.profiling else None
+        self.chain_id=k
+        chain=self.new_chain(seed)
+        writer=recorder=None
+        if self.trace_dir is not None:
+            os.makedirs(self.trace_dir,exist_ok=True)
+            writer=TraceWriter(os.path.join(self.trace_dir,'trace-{0}.bin'.format(k)),len(self.M))
+            recorder=self.trace_recorder(writer,chain)
+        try:
+            while True:
+                with counter.get_lock():
+                    n=min(self.segment_steps,iterations-counter.value)
+                    counter.value+=n
+                if n<=0:
+                    break
+                self.advance(chain,n,recorder=recorder)
+        finally:
+            if writer is not None:
+                writer.close()
+        queue.put(('done',k,(chain.results(),chain.step,chain.samples,self.profile)))
+
+    def run_distributed(self,process_iter,seeds):
+        '''Same as run_chains with the chains handed out as segments to the workers connected to a Coordinator
+        on self.address. local_workers of them are started here. With the tcp backend process_num is the number
+        of segments, which can be more than the number of workers'''
+        coordinator=Coordinator(self.address,self.authkey,self.segment_timeout)
+        print('The coordinator is listening on {0}:{1}'.format(*coordinator.address))
+        if self.authkey is None:#only workers of this machine can connect
+            print('Start more workers with: python -m mcmc.distributed {0}:{1} {2}'.format(coordinator.address[0],coordinator.address[1],coordinator.authkey.decode()))
+        workers=[multiprocessing.Process(target=run_worker,args=(coordinator.address,coordinator.authkey)) for i in range(self.local_workers)]
+        for w in workers:
+            w.start()
+        sums=[None]*len(process_iter)
+        try:
+            for k,result,profile in coordinator.run(self,list(enumerate(zip(process_iter,seeds)))):
+                sums[k]=result[:3]
+                self.uniques.update(result[3])
+                if profile is not None:
+                    self.profile.merge(profile)
+        finally:
+            coordinator.close()
+        for w in workers:
+            w.join()
+        if coordinator.reassigned:
+            print('Segments handed out again after losing their worker: {0}'.format(coordinator.reassigned))
+        return(sums)
+
+    def run_to_convergence(self,process_iter,seeds):
+        '''Run one chain per entry of process_iter until the split R-hat of every observable is at most rhat_target
+        and its effective sample size at least ess_target, until max_time seconds have passed, or until every chain
+        has taken its iterations. The chains report their observables in batches of report_every kept samples.
+        Merges the unique graphs into self.uniques and returns the per chain sums and the number of samples drawn'''
+        queue=multiprocessing.Queue()
+        stop=multiprocessing.Event()
+        workers=[multiprocessing.Process(target=self.guarded_worker,args=(self.convergence_worker,queue,k,process_iter[k],seeds[k],queue,stop)) for k in range(len(process_iter))]
+        for w in workers:
+            w.start()
+        per_task=self.batch_chains if self.engine=='batched' else 1
+        chains=[ChainSummary(3) for c in range(len(workers)*per_task)]
+        sums=[None]*len(workers)
+        samples=0
+        done=0
+        start=timeit.default_timer()
+        while done<len(workers):
+            kind,k,data=self.next_message(queue,workers,timeout=0.5)
+            if kind=='batch':
+                if not stop.is_set():#the diagnostics are those of the samples the stop was decided on
+                    chains[k].add_batch(data)
+            elif kind=='done':
+                sums[k]=data[:3]
+                self.uniques.update(data[3])
+                samples+=data[4]
+                if data[5] is not None:
+                    self.profile.merge(data[5])
+                done+=1
+            if not stop.is_set():
+                if self.max_time is not None and timeit.default_timer()-start>self.max_time:
+                    print('The time budget of {0} s is used up, stopping the chains'.format(self.max_time))
+                    stop.set()
+                elif kind=='batch' and self.converged(chains):
+                    stop.set()
+        for w in workers:
+            w.join()
+        self.rhat=split_rhat(chains)
+        self.ess=effective_sample_size(chains)
+        print('Samples drawn: {0}. R-hat (degree of vertex 0, edges, maximum path): {1}. ESS: {2}'.format(samples,self.rhat,self.ess))
+        return(sums,samples)
+
+    def run_tempering(self,iterations,seeds):
+        '''Replica exchange: one process per temperature of the ladder, each running a chain of iterations steps.
+        Every swap_every steps neighbouring replicas attempt to swap their states, alternating between the even and
+        the odd pairs. Only the replica at temperature T contributes to the statistics; its unique graphs are merged
+        into self.uniques and its sums are returned as the only chain. Sets swap_rates'''
+        if self.T not in self.temperatures:
+            print ("The temperature ladder {0} should contain T={1}".format(self.temperatures,self.T))
+            raise ValueError
+        n=len(self.temperatures)
+        pipes=[multiprocessing.Pipe() for k in range(n-1)]#pipe k joins replicas k and k+1
+        queue=multiprocessing.Queue()
+        workers=[]
+        for k in range(n):
+            left=pipes[k-1][1] if k>0 else None
+            right=pipes[k][0] if k<n-1 else None
+            workers.append(multiprocessing.Process(target=self.guarded_worker,args=(self.tempering_worker,queue,k,iterations,seeds[k],left,right,queue)))
+        for w in workers:
+            w.start()
+        sums=None
+        accepted=[0]*(n-1)
+        attempts=[0]*(n-1)
+        for w in workers:#results are read before joining, a worker cannot exit while its message is still in the pipe
+            kind,k,(result,swaps,profile)=self.next_message(queue,workers)
+            if result is not None:
+                sums=[result[:3]]
+                self.uniques.update(result[3])
+            if k<n-1:
+                attempts[k],accepted[k]=swaps
+            if profile is not None:
+                self.profile.merge(profile)
+        for w in workers:
+            w.join()
+        self.swap_rates=[a/float(t) if t else 0.0 for a,t in zip(accepted,attempts)]
+        print('Swap acceptance between neighbouring temperatures: {0}'.format(self.swap_rates))
+        return(sums)
+
+    def tempering_worker(self,k,iterations,seed,left,right,queue):
+        '''Replica k of a replica exchange run. left and right are the pipes to replicas k-1 and k+1 (None at the ends).
+        The upper replica of a pair sends (theta, graph key) and the lower one answers with its own key if the swap is
+        accepted, None otherwise, so only two small messages cross the pipe per attempt.
+        Puts ('done',k,(results or None, (attempts, accepts) with replica k+1, profile)) on queue when done'''
+        cold=self.temperatures[k]==self.T
+        self.T=self.temperatures[k]#this process samples exp(-theta/T_k)
+        self.profile=PhaseProfile() if self.profiling else None
+        chain=self.new_chain(seed)
+        burn_in=None if cold else iterations#the other replicas keep no samples
+        attempts=accepted=0
+        r=0
+        while chain.step<iterations:
+            self.advance(chain,min(self.swap_every,iterations-chain.step),burn_in=burn_in)
+            if right is not None and k%2==r%2:
+                theta,key=right.recv()
+                attempts+=1
+                if self.swap_accepted(chain.m1.theta,theta,self.temperatures[k],self.temperatures[k+1],chain.rng.uniform()):
+                    right.send(self.graph_key(chain.G))
+                    self.adopt_state(chain,key)
+                    accepted+=1
+                else:
+                    right.send(None)
+            elif left is not None and (k-1)%2==r%2:
+                left.send((chain.m1.theta,self.graph_key(chain.G)))
+                key=left.recv()
+                if key is not None:
+                    self.adopt_state(chain,key)
+            r+=1
+        queue.put(('done',k,(chain.results() if cold else None,(attempts,accepted),self.profile)))
+
+    def guarded_worker(self,target,queue,k,*args):
+        '''Process target that runs target(k,*args). If it raises, ('error',k,(exception,traceback)) is put on queue
+        so that next_message raises the exception in main instead of waiting for the worker's results'''
+        try:
+            target(k,*args)
+        except Exception as e:
+            queue.put(('error',k,(picklable_exception(e),traceback.format_exc())))
+
+    def next_message(self,queue,workers,timeout=None):
+        '''Next (kind,k,data) message of the worker processes on queue, waiting as long as a worker is running, or
+        (None,None,None) after timeout seconds if timeout is given. The exception of a worker that failed is raised
+        here after stopping the other workers, and a RuntimeError if a worker died without a message'''
+        while True:
+            try:
+                kind,k,data=queue.get(timeout=1.0 if timeout is None else timeout)
+            except Empty:
+                kind=None
+            if kind=='error':
+                self.stop_workers(workers)
+                print ("Chain {0} failed:\n{1}".format(k,data[1]))
+                raise data[0]
+            if kind is not None:
+                return((kind,k,data))
+            if any(w.exitcode not in (None,0) for w in workers):
+                self.stop_workers(workers)
+                print ("A worker process exited with code {0} without sending its results".format([w.exitcode for w in workers]))
+                raise RuntimeError
+            if timeout is not None:
+                return((None,None,None))
+
+    def stop_workers(self,workers):
+        for w in workers:
+            if w.is_alive():
+                w.terminate()
+            w.join()
+
+    def swap_accepted(self,theta1,theta2,T1,T2,U):
+        '''Metropolis test for swapping the states of the replicas at T1 (energy theta1) and T2 (energy theta2)'''
+        a=(theta1-theta2)*(1.0/T1-1.0/T2)
+        return(a>=0 or math.exp(a)>=U)
+
+    def adopt_state(self,chain,key):
+        '''Replace the current graph of chain by the graph with the given key, keeping its random stream, step count and statistics'''
+        new=self.chain_at(self.graph_from_key(key,'array' if isinstance(chain.G,ArrayGraph) else 'networkx'),chain.rng)
+        chain.G=new.G
+        chain.m1=new.m1
+        chain.moves=new.moves
+
+    def write_profile(self,elapsed):
+        '''Print the merged profile of all chains, or write it to profile_file'''
+        report='Profile of all chains (wall time {0:.3f} s)\n{1}\n'.format(elapsed,self.profile.report())
+        if self.profile_file is None:
+            print(report)
+        else:
+            with open(self.profile_file,'w') as f:
+                f.write(report)
+            print('The profile is written in ',self.profile_file)
+
+    def converged(self,chains):
+        '''True once every observable meets rhat_target and ess_target'''
+        return(bool(np.all(split_rhat(chains)<=self.rhat_target) and np.all(effective_sample_size(chains)>=self.ess_target)))
+
+    def convergence_worker(self,k,iterations,seed,queue,stop):
+        '''Chain k of a convergence run. Sends a ('batch',k,observables) message for every report_every kept samples
+        and ('done',k,results+(samples,)) when it is stopped or has taken its iterations'''
+        self.profile=PhaseProfile() if self.profiling else None
+        chain=self.new_chain(seed)
+        observed=[]
+        if isinstance(chain,BatchedChains):#obs holds one row per chain of the batch
+            recorder=lambda batch,obs:observed.append(obs)
+        else:
+            recorder=lambda G,m:observed.append((m.degree,G.number_of_edges(),m.max_path))
+        if self.burn_in>0:
+            self.advance(chain,min(self.burn_in,iterations))
+        block=self.report_every*self.thin
+        while chain.step<iterations and not stop.is_set():
+            self.advance(chain,min(block,iterations-chain.step),recorder=recorder)
+            if observed and isinstance(chain,BatchedChains):#every chain of the batch is summarised on its own
+                X=np.array(observed)
+                for c in range(chain.K):
+                    queue.put(('batch',k*chain.K+c,X[:,c]))
+                del observed[:]
+            elif observed:
+                queue.put(('batch',k,np.array(observed)))
+                del observed[:]
+        queue.put(('done',k,chain.results()+(chain.samples,self.profile)))
     
    
     def dist(self,a,b):
@@ -94,102 +596,287 @@ class MarkovChain:
                         elif li.split("=")[0]=='r':
                             
                             self.r=float(li.split("=")[1])
-                            print(self.r)
                         elif li.split("=")[0]=='iterations':
                             self.iterations=int(li.split("=")[1])
-                            print(self.iterations)
                         elif li.split("=")[0]=='process_num':
                             self.process_num=int(li.split("=")[1])
+                        elif li.split("=")[0]=='seed':
+                            self.seed=int(li.split("=")[1])
+                        elif li.split("=")[0]=='convergence':
+                            self.convergence=li.split("=")[1].strip().lower() in ('1','true','yes')
+                        elif li.split("=")[0]=='rhat':
+                            self.rhat_target=float(li.split("=")[1])
+                        elif li.split("=")[0]=='ess':
+                            self.ess_target=float(li.split("=")[1])
+                        elif li.split("=")[0]=='max_time':
+                            self.max_time=float(li.split("=")[1])
+                        elif li.split("=")[0]=='report_every':
+                            self.report_every=int(li.split("=")[1])
+                        elif li.split("=")[0]=='backend':
+                            self.backend=li.split("=")[1].strip()
+                            if self.backend not in self.backends:
+                                print ("Unknown backend {0}. Choose one of {1}".format(self.backend,self.backends))
+                                raise ValueError
+                        elif li.split("=")[0]=='scheduling':
+                            self.scheduling=li.split("=")[1].strip()
+                            if self.scheduling not in self.schedulings:
+                                print ("Unknown scheduling {0}. Choose one of {1}".format(self.scheduling,self.schedulings))
+                                raise ValueError
+                        elif li.split("=")[0]=='segment_steps':
+                            self.segment_steps=int(li.split("=")[1])
+                            if self.segment_steps<1:
+                                print ("segment_steps should be a positive integer")
+                                raise ValueError
+                        elif li.split("=")[0]=='address':
+                            self.address=parse_address(li.split("=")[1])
+                        elif li.split("=")[0]=='authkey':
+                            self.authkey=li.split("=")[1].strip().encode()
+                        elif li.split("=")[0]=='local_workers':
+                            self.local_workers=int(li.split("=")[1])
+                        elif li.split("=")[0]=='segment_timeout':
+                            self.segment_timeout=float(li.split("=")[1])
+                        elif li.split("=")[0]=='trace_dir':
+                            self.trace_dir=li.split("=")[1].strip()
+                        elif li.split("=")[0]=='sketch_capacity':
+                            self.sketch_capacity=int(li.split("=")[1])
+                            if self.sketch_capacity<1:
+                                print ("sketch_capacity should be a positive integer")
+                                raise ValueError
+                        elif li.split("=")[0]=='unique_budget':
+                            self.unique_budget=int(li.split("=")[1])
+                            if self.unique_budget<1:
+                                print ("unique_budget should be a positive integer")
+                                raise ValueError
+                        elif li.split("=")[0]=='spill_dir':
+                            self.spill_dir=li.split("=")[1].strip()
+                        elif li.split("=")[0]=='temperatures':
+                            self.temperatures=sorted(float(t) for t in li.split("=")[1].split(","))
+                            if len(self.temperatures)<2 or self.temperatures[0]<=0:
+                                print ("temperatures should be at least two positive numbers separated by commas")
+                                raise ValueError
+                        elif li.split("=")[0]=='swap_every':
+                            self.swap_every=int(li.split("=")[1])
+                            if self.swap_every<1:
+                                print ("swap_every should be a positive integer")
+                                raise ValueError
+                        elif li.split("=")[0]=='checkpoint_dir':
+                            self.checkpoint_dir=li.split("=")[1].strip()
+                        elif li.split("=")[0]=='checkpoint_every':
+                            self.checkpoint_every=float(li.split("=")[1])
+                        elif li.split("=")[0]=='resume':
+                            self.resume=li.split("=")[1].strip().lower() in ('1','true','yes')
+                        elif li.split("=")[0]=='profile':
+                            self.profiling=li.split("=")[1].strip().lower() in ('1','true','yes')
+                        elif li.split("=")[0]=='profile_file':
+                            self.profile_file=li.split("=")[1].strip()
+                        elif li.split("=")[0]=='burn_in':
+                            self.burn_in=int(li.split("=")[1])
+                            if self.burn_in<0:
+                                print ("burn_in should be zero or a positive integer")
+                                raise ValueError
+                        elif li.split("=")[0]=='thin':
+                            self.thin=int(li.split("=")[1])
+                            if self.thin<1:
+                                print ("thin should be a positive integer")
+                                raise ValueError
+                        elif li.split("=")[0]=='engine':
+                            self.engine=li.split("=")[1].strip()
+                            if self.engine not in self.engines:
+                                print ("Unknown engine {0}. Choose one of {1}".format(self.engine,self.engines))
+                                raise ValueError
+                        elif li.split("=")[0]=='batch_chains':
+                            self.batch_chains=int(li.split("=")[1])
+                            if self.batch_chains<1:
+                                print ("batch_chains should be a positive integer")
+                                raise ValueError
+                        elif li.split("=")[0]=='batched_max_nodes':
+                            self.batched_max_nodes=int(li.split("=")[1])
+                        elif li.split("=")[0]=='proposal':
+                            self.proposal=li.split("=")[1].strip()
+                            if self.proposal not in self.proposals:
+                                print ("Unknown proposal mode {0}. Choose one of {1}".format(self.proposal,self.proposals))
+                                raise ValueError
+                        elif li.split("=")[0]=='distances':
+                            self.distance_storage=li.split("=")[1].strip()
+                            if self.distance_storage not in self.distance_storages:
+                                print ("Unknown distance storage {0}. Choose one of {1}".format(self.distance_storage,self.distance_storages))
+                                raise ValueError
 
                 else:
                     tmp = line.split(",")
                     self.M.append((float(tmp[0]), float(tmp[1])))
         
         f.close()
+        if self.overrides:
+            for name,value in self.overrides.items():
+                setattr(self,name,value)
+        print(self.r)#printed once the overrides are applied, so that they show the values used
+        print(self.iterations)
+        self.set_nodes(self.M)
+
+    def set_nodes(self,M,D=None):
+        '''Use the list of node tuples M, as read by input_arg, and compute its edge weights unless D is given'''
+        self.M=list(M)
+        self.node_index={v:i for i,v in enumerate(self.M)}#position of every node tuple in M
+        self.D=self.distance_matrix() if D is None else D
+
+    def spec(self):
+        '''ChainSpec of this instance. Only scalar settings are included, not the graphs or the unique graph counts'''
+        params=tuple(sorted((name,value) for name,value in vars(self).items()
+                            if name not in ('T','r') and isinstance(value,(bool,int,float,str,bytes,tuple,type(None)))))
+        distances=self.D if isinstance(self.D,CondensedDistances) and self.D.path is not None else None
+        return(ChainSpec(np.array(self.M,dtype=float),self.T,self.r,params,distances))
+
+    @classmethod
+    def from_spec(cls,spec):
+        '''MarkovChain with the nodes and settings of a ChainSpec'''
+        m=cls()
+        for name,value in spec.params:
+            setattr(m,name,value)
+        m.T=spec.T
+        m.r=spec.r
+        m.set_nodes([tuple(p) for p in spec.points.tolist()],spec.distances)
+        return(m)
+
+    def distance_matrix(self):
+        '''Edge weights between every pair of nodes in M, computed once per input.
+        D[i,j] is the weight of the edge between M[i] and M[j]'''
+        if self.distance_storage=='condensed':
+            return(CondensedDistances(self.M))
+        elif self.distance_storage=='memmap':
+            return(CondensedDistances.memmap(self.M))
+        return(pairwise_distances(self.M))
 
         
     
+    def dense_distances(self):
+        '''D as a dense N x N array, for the batched and exact engines'''
+        if isinstance(self.D,CondensedDistances):
+            return(self.D.dense())
+        return(np.asarray(self.D))
+
     def make_init_graph(self):
         '''Function to  make the initial graph G1 with the given  nodes. 
         I have just connected node 0 or the first node in M to all other nodes in M'''
-        G1=nx.Graph()
+        G1=load_networkx().Graph()
         G1.add_nodes_from(self.M)
         for i in range(1,len(self.M)):
             
-            G1.add_edge(self.M[0],self.M[i],weight=self.dist(self.M[0],self.M[i]))
+            G1.add_edge(self.M[0],self.M[i],weight=self.D[0,i])
         return(G1)
        
    
-    def graph_change(self,idx1,idx2,G1):
+    def graph_change(self,idx1,idx2,G1,bridges=None):
         '''Function to change the state of the edge between the given nodes. 
-        If the edge is not present, it is added else it is removed if it is not a bridge'''
-
-        G2=deepcopy(G1)
-        
+        If the edge is not present, it is added else it is removed if it is not a bridge.
+        bridges is the bridge set of G1 if the caller already has it'''
         v1=self.M[idx1]
         v2=self.M[idx2]
-        
-        if G2.has_edge(v1,v2)==False:#Edge between v1 and v2 is not present. Hence add the edge.
-            
-            G2.add_edge(v1,v2,weight=self.dist(v1,v2))
+
+        if G1.has_edge(v1,v2)==False:#Edge between v1 and v2 is not present. Hence add the edge.
+            G2=deepcopy(G1)
+            G2.add_edge(v1,v2,weight=self.D[idx1,idx2])
             return(G2)
         
         else:
-            if len(nx.minimum_edge_cut(G2,v1,v2))==1:#Edge is present but it is a bridge. The graph is not altered 
+            if bridges is None:
+                bridges=find_bridges(G1.adj)
+            if frozenset((v1,v2)) in bridges:#Edge is present but it is a bridge. The graph is not altered 
 
                 return(-1)
             
             else:
+                G2=deepcopy(G1)
                 G2.remove_edge(v1,v2)#Edge is removed if it is present in graph but not a bridge
                 return(G2)
 
     
     def calculate_bridges(self,G):
         '''Function to calculate the number of bridges in a given graph'''
-        if type(G)!=nx.Graph:
+        if type(G)!=load_networkx().Graph:
             print ("Argument passed to the function should be a Graph")
             raise TypeError
             
-        b=0
-        for i in G.edges():
-    
-            if len(nx.minimum_edge_cut(G,i[0],i[1]))==1:
-                b+=1
-        return(b)
+        return(len(find_bridges(G.adj)))
     
     
     def calculate_q(self,G):
         '''Function to calculate the q(m|n)  probabilitie by taking in Xn as argument'''
         b=self.calculate_bridges(G)
-        nodes=float(G.number_of_nodes())
+        return(self.q_from_bridges(G.number_of_nodes(),b))
+
+    def q_from_bridges(self,n,b):
+        '''q(m|n) for a graph with n nodes and b bridges: one over the number of edges that can be flipped'''
+        nodes=float(n)
         q=(nodes*(nodes-1)/2)-b
         return(1/q)
 
     
     def theta_func(self,G):
         '''Funtion to return theta(Xi)'''
-        theta=self.r*G.size(weight='weight')
-        for i in range(1,G.number_of_nodes()):
-            theta+=nx.shortest_path_length(G,source=G.nodes()[0],target=G.nodes()[i],weight='weight')
+        nodes=G.nodes()
+        P=load_networkx().single_source_dijkstra_path_length(G,nodes[0],weight='weight')#one Dijkstra gives the paths to every vertex
+        return(self.path_theta(G.size(weight='weight'),[P[v] for v in nodes[1:]]))
 
+    def path_theta(self,size,paths):
+        '''theta from the total edge weight and the shortest path lengths from vertex 0'''
+        theta=self.r*size
+        for p in paths:
+            theta+=p
         return(theta)
 
+    def state_metrics(self,G):
+        '''Cached metrics of a chain state (nx.Graph or ArrayGraph): theta, bridges, q,
+        the shortest paths from vertex 0 and the degree of vertex 0'''
+        if isinstance(G,ArrayGraph):
+            paths=G.shortest_paths(0)
+            theta=G.theta(self.r)#running sums, no pass over the vertices
+            degree=G.degree(0)
+            bridges=G.bridges()
+        else:
+            P=load_networkx().single_source_dijkstra_path_length(G,self.M[0],weight='weight')
+            paths=[P[v] for v in G.nodes()]
+            theta=self.path_theta(G.size(weight='weight'),paths[1:])
+            degree=G.degree(self.M[0])
+            bridges=find_bridges(G.adj)
+        q=self.q_from_bridges(len(paths),len(bridges))
+        return(StateMetrics(theta,bridges,q,paths,degree))
+
     #Function to implement metropolis-hastings algorithm
-    def MH(self,G1,G2):
+    def MH(self,G1,G2,m1=None,m2=None):
+        '''m1 and m2 are the cached state_metrics of G1 and G2. They are computed here if not given'''
+        if m1 is None:
+            prof=self.profile
+            t=timeit.default_timer() if prof is not None else 0
+            theta1,theta2=self.theta_func(G1),self.theta_func(G2)
+            q1,q2=self.calculate_q(G1),self.calculate_q(G2)
+            if prof is not None:
+                prof.add('mh_metrics',timeit.default_timer()-t)
+            return(self.metropolis(theta1,theta2,q1,q2))
+        return(self.metropolis(m1.theta,m2.theta,m1.q,m2.q))
 
-        f=math.exp(-float(self.theta_func(G2)-self.theta_func(G1))/self.T)
+    def metropolis(self,theta1,theta2,q1,q2):
+        '''Metropolis-Hastings test for a move from a state with (theta1,q1) to a state with (theta2,q2)'''
+        try:
+            f=math.exp(-float(theta2-theta1)/self.T)
+        except OverflowError:#theta dropped by more than ~700*T, the move is accepted whatever q is
+            f=float('inf')
 
-        q=self.calculate_q(G2)/self.calculate_q(G1)
+        q=q2/q1
         aij=min(f*q,1)
-        U=np.random.random()#randomly chosen number between 0 and 1
+        U=self.rng.uniform() if self.rng is not None else np.random.random()#randomly chosen number between 0 and 1
         if aij>=U: 
+            if self.profile is not None:
+                self.profile.count('mh_accepts')
             return(1)#flag to accept the proposed graph change if aij >= U
         else:
+            if self.profile is not None:
+                self.profile.count('mh_rejects')
             return(0)
 
     #Function to return the maximum of the shortest path from vertex 0 to other vertices
     def max_shortest_path(self,G):
-        P=nx.shortest_path_length(G, source=self.M[0],weight='weight')
+        P=load_networkx().shortest_path_length(G, source=self.M[0],weight='weight')
         max_path=-1
         for i in P:
             max_path=max(max_path,P[i])
@@ -199,7 +886,10 @@ class MarkovChain:
 
     #Function to count uniques
     def graph_count(self,G,uniques):
-        key=frozenset(G.edges(nbunch=self.M))
+        key=self.graph_key(G)
+        if isinstance(uniques,(SpaceSaving,SpillingCounter)):
+            uniques.add(key)
+            return
 
         if key in uniques:#increment count if G has been observed before
             uniques[key]+=1
@@ -207,56 +897,385 @@ class MarkovChain:
             uniques[key]=1
             
 
+    def graph_key(self,G):
+        '''Key of G in the unique graph dictionary: an int bitmask with one bit per vertex pair of M (see edge_key).
+        ArrayGraph states get the same key as the equivalent nx.Graph'''
+        if isinstance(G,ArrayGraph):
+            return(G.key)
+        index=self.node_index
+        return(edge_key(((index[u],index[v]) for u,v in G.edges_iter()),len(self.M)))
+
+    def decode_key(self,key):
+        '''Edge list, as pairs of node tuples, of the graph with the given key'''
+        return([(self.M[i],self.M[j]) for i,j in key_pairs(key,len(self.M))])
+
+    def move_set(self,bridges,moves=None,indexed=False):
+        '''MoveSet for a state with the given bridge set, or moves updated to it. The bridges are
+        vertex indices for the array engine (indexed) and node tuples for the networkx engine'''
+        n=len(self.M)
+        if moves is None:
+            moves=MoveSet(n)
+        if indexed:
+            pairs={pair_index(i,j,n) for i,j in bridges}
+        else:
+            index=self.node_index
+            pairs={pair_index(index[u],index[v],n) for u,v in bridges}
+        moves.update(pairs)
+        return(moves)
+
+    def draw_pair(self,bridges,moves=None,indexed=False):
+        '''Vertex index pair of the next proposal, uniform over the N(N-1)/2-b pairs that are not bridges.
+        With a MoveSet the pair is read directly from the valid moves, otherwise
+        random pairs are redrawn until one is not in bridges'''
+        if self.profile is not None:
+            self.profile.count('proposals')
+        if moves is not None:
+            return(moves.sample(self.rng.uniform()))
+        while True:
+            A=self.rng.pair()#Choose a tuple randomly without replacement from the range of indices in M
+            e=frozenset(A) if indexed else frozenset((self.M[A[0]],self.M[A[1]]))
+            if e not in bridges:
+                return(A)
+            if self.profile is not None:
+                self.profile.count('bridge_rejections')
+
+    def chain_task(self,task):
+        '''Pool task: (chain number, (iterations, seed)). Returns the chain number, the chain's results
+        and its PhaseProfile (None unless profiling is on)'''
+        k,(iterations,seed)=task
+        self.profile=PhaseProfile() if self.profiling else None
+        self.chain_id=k
+        if self.checkpoint_dir is not None:
+            result=self.checkpointed_chain(k,iterations,seed)
+        else:
+            result=self.mc_chain_generator(iterations,seed)
+        if self.profile is not None:#cost of sending the results back to main
+            t=timeit.default_timer()
+            size=len(pickle.dumps(result,pickle.HIGHEST_PROTOCOL))
+            self.profile.add('result_pickle',timeit.default_timer()-t)
+            self.profile.count('result_bytes',size)
+        return(k,result,self.profile)
+
+    def kept_samples(self,iterations,burn_in=None,thin=None):
+        '''Number of steps of a chain of the given length that contribute to the statistics'''
+        burn_in=self.burn_in if burn_in is None else burn_in
+        thin=self.thin if thin is None else thin
+        if iterations<=burn_in:
+            return(0)
+        return((iterations-burn_in-1)//thin+1)
+
+    def task_samples(self,iterations):
+        '''Kept samples of a worker task of the given number of iterations, summed over its chains'''
+        if self.engine=='batched':
+            return(self.batch_chains*self.kept_samples(iterations))
+        return(self.kept_samples(iterations))
+
+    def new_uniques(self):
+        '''Empty unique graph counts: exact, or a SpaceSaving sketch if sketch_capacity is set.
+        Exact counts spill to disk past unique_budget keys if it is set'''
+        if self.sketch_capacity is not None:
+            return(SpaceSaving(self.sketch_capacity))
+        if self.unique_budget is not None:
+            return(SpillingCounter(self.unique_budget,len(self.M),self.spill_dir))
+        return(Counter())
+
+    def new_chain(self,seed=None):
+        '''Chain at its initial graph, with the engine and proposal mode of this instance.
+        seed (int or numpy SeedSequence) makes the chain reproducible.
+        The batched engine returns a BatchedChains of batch_chains chains instead'''
+        if self.engine=='exact':
+            print ("The exact engine does not run chains")
+            raise ValueError
+        if self.engine=='batched':
+            rng=np.random.Generator(np.random.PCG64(seed))
+            chain=BatchedChains(self.dense_distances(),self.batch_chains,self.r,self.T,rng)
+        else:
+            G=ArrayGraph.star(self.D) if self.engine=='array' else self.make_init_graph()#initial graph
+            chain=self.chain_at(G,ChainRNG(seed,len(self.M)))
+        chain.unique_graphs=self.new_uniques()
+        return(chain)
+
+    def chain_at(self,G,rng):
+        '''Chain whose current state is G'''
+        m1=self.state_metrics(G)#metrics of G, only recomputed when a move is accepted
+        moves=None
+        if self.proposal=='direct':
+            moves=self.move_set(m1.bridges,indexed=isinstance(G,ArrayGraph))
+        return(ChainState(G,m1,moves,rng))
+
+    def graph_from_key(self,key,engine):
+        '''Graph with the edges of key, as an ArrayGraph for the array engine and an nx.Graph otherwise'''
+        pairs=key_pairs(key,len(self.M))
+        if engine=='array':
+            G=ArrayGraph(self.D)
+            for i,j in pairs:
+                G.flip(i,j)
+            G.last=None
+        else:
+            G=load_networkx().Graph()
+            G.add_nodes_from(self.M)
+            for i,j in pairs:
+                G.add_edge(self.M[i],self.M[j],weight=self.D[i,j])
+        return(G)
+
+    def chain_snapshot(self,chain):
+        '''Everything needed to continue chain, as a dict of plain values (see restore_chain).
+        With direct proposals the order of the MoveSet is saved too, since it decides the moves drawn'''
+        return({'M':self.M,'engine':'array' if isinstance(chain.G,ArrayGraph) else 'networkx',
+                'key':self.graph_key(chain.G),'rng':chain.rng,'step':chain.step,'samples':chain.samples,
+                'sums':(chain.exp_d0,chain.exp_max_path,chain.exp_edgs),
+                'moves':None if chain.moves is None else chain.moves.order()})
+
+    def restore_chain(self,state):
+        '''Chain saved by chain_snapshot. Its unique graph counts are taken from state['unique_graphs'] if present'''
+        if state['M']!=self.M:
+            print ("The checkpoint was made for a different set of nodes")
+            raise ValueError
+        chain=self.chain_at(self.graph_from_key(state['key'],state['engine']),state['rng'])
+        chain.step=state['step']
+        chain.samples=state['samples']
+        chain.exp_d0,chain.exp_max_path,chain.exp_edgs=state['sums']
+        if chain.moves is not None and state.get('moves') is not None:
+            chain.moves.set_order(*state['moves'])
+        chain.unique_graphs=self.new_uniques()
+        chain.unique_graphs.update(state.get('unique_graphs',{}))
+        return(chain)
+
+    def checkpointed_chain(self,k,iterations,seed=None):
+        '''Chain k of a run with checkpoints in checkpoint_dir, saved every checkpoint_every seconds.
+        With resume set the chain continues from its last checkpoint, if there is one.
+        Returns the same results as mc_chain_generator'''
+        ckpt=Checkpointer(self.checkpoint_dir,k)
+        state=ckpt.load() if self.resume else None
+        if state is None:
+            ckpt.reset()
+            chain=self.new_chain(seed)
+        else:
+            chain=self.restore_chain(state)
+        recorder=lambda G,m:ckpt.record(self.graph_key(G))
+        last=timeit.default_timer()
+        while chain.step<iterations:
+            self.advance(chain,min(self.checkpoint_steps,iterations-chain.step),recorder=recorder)
+            if timeit.default_timer()-last>=self.checkpoint_every:
+                ckpt.save(self.chain_snapshot(chain))
+                last=timeit.default_timer()
+        ckpt.save(self.chain_snapshot(chain))
+        return(chain.results())
+
+    def advance(self,chain,iterations,burn_in=None,thin=None,recorder=None):
+        '''Run chain for iterations more steps. Statistics are collected on the steps burn_in, burn_in+thin, ...
+        counted from the start of the chain (defaults self.burn_in and self.thin).
+        recorder, if given, is called as recorder(G,metrics) on every kept sample'''
+        burn_in=self.burn_in if burn_in is None else burn_in
+        thin=self.thin if thin is None else thin
+        self.rng=chain.rng
+        if isinstance(chain,BatchedChains):
+            self.batched_steps(chain,iterations,burn_in,thin,recorder)
+        elif isinstance(chain.G,ArrayGraph):
+            self.array_steps(chain,iterations,burn_in,thin,recorder)
+        else:
+            self.networkx_steps(chain,iterations,burn_in,thin,recorder)
+
     #Function to generate the markov chain
-    def mc_chain_generator(self,iterations):
-        unique_graphs={}
-        #uniques.clear()
+    def mc_chain_generator(self,iterations,seed=None,burn_in=None,thin=None):
+        '''seed (int or numpy SeedSequence) makes the chain reproducible; the same seed gives the same chain with either engine.
+        Statistics are collected on steps burn_in, burn_in+thin, burn_in+2*thin, ... (defaults self.burn_in and self.thin)'''
         self.test+=1
-        exp_d0=0#Expectation of degree of vertex 0
-        exp_edgs=0
-        exp_max_path=0
-        G1=self.make_init_graph()#initial graph
-        for i in range(iterations):#Propose graph  modification at each simulation step
-            G2=-1
-            while(G2==-1):#if  the randomly selected edge is a bridge select a different edge
-                A=random.sample(range(len(self.M)), 2)#Choose a tuple randomly without replacement from the range of indices in M
-                #A=np.random.choice(len(self.M), 2,replace=0)#Choose a tuple randomly without replacement from the range of indices in M
-                G2=self.graph_change(A[0],A[1],G1)#graph_change  function returns -1 if the edge  is  a bridge 
+        chain=self.new_chain(seed)
+        if self.trace_dir is None:
+            self.advance(chain,iterations,burn_in,thin)
+            return(chain.results())
+        os.makedirs(self.trace_dir,exist_ok=True)#the workers may all get here at once
+        writer=TraceWriter(os.path.join(self.trace_dir,'trace-{0}.bin'.format(self.chain_id)),len(self.M))
+        try:
+            self.advance(chain,iterations,burn_in,thin,self.trace_recorder(writer,chain))
+        finally:
+            writer.close()
+        return(chain.results())
 
-                            
-            accept=self.MH(G1,G2)
+    def trace_recorder(self,writer,chain):
+        '''Recorder for advance that appends every kept sample of chain to the TraceWriter writer'''
+        if isinstance(chain,BatchedChains):
+            return(lambda batch,obs:writer.extend(batch.keys,batch.theta,obs[:,0],obs[:,1],obs[:,2]))
+        return(lambda G,m:writer.append(self.graph_key(G),m.theta,m.degree,G.number_of_edges(),m.max_path))
+
+    def networkx_steps(self,chain,iterations,burn_in,thin,recorder=None):
+        '''Steps of a chain whose state is an nx.Graph. Every proposal is a new graph'''
+        unique_graphs=chain.unique_graphs
+        exp_d0=chain.exp_d0#Expectation of degree of vertex 0
+        exp_edgs=chain.exp_edgs
+        exp_max_path=chain.exp_max_path
+        samples=chain.samples
+        G1=chain.G
+        m1=chain.m1
+        moves=chain.moves
+        prof=self.profile
+        clock=timeit.default_timer
+        for i in range(chain.step,chain.step+iterations):#Propose graph  modification at each simulation step
+            if prof is not None:
+                t0=clock()
+            A=self.draw_pair(m1.bridges,moves)#never a bridge, so graph_change always returns a graph
+            if prof is not None:
+                t1=clock()
+                prof.add('proposal',t1-t0)
+            G2=self.graph_change(A[0],A[1],G1,m1.bridges)
+            if prof is not None:
+                t0=clock()
+                prof.add('graph_copy',t0-t1)
+
+            m2=self.state_metrics(G2)
+            if prof is not None:
+                t1=clock()
+                prof.add('metrics',t1-t0)
+            accept=self.MH(G1,G2,m1,m2)
             if accept==1:#Accept the change if MH function returns 1
                 #print(i,"accept")
-                G1=deepcopy(G2)
+                G1=G2#G2 is a fresh copy made by graph_change
+                m1=m2
+                if moves is not None:
+                    self.move_set(m1.bridges,moves)
+            if prof is not None:
+                t0=clock()
+                prof.add('mh',t0-t1)
 
+            if i<burn_in or (i-burn_in)%thin:#observables are only evaluated on kept samples
+                continue
             #Maintaining running averages for performing statistical analysis later
-            exp_d0+=G1.degree(self.M[0])
+            exp_d0+=m1.degree
             exp_edgs+=G1.number_of_edges()
-            exp_max_path+=self.max_shortest_path(G1)
+            exp_max_path+=m1.max_path
+            samples+=1
             self.graph_count(G1,unique_graphs)
-        
-        return(exp_d0,exp_max_path,exp_edgs,unique_graphs)
-        
+            if recorder is not None:
+                recorder(G1,m1)
+            if prof is not None:
+                prof.add('statistics',clock()-t0)
+
+        chain.G=G1
+        chain.m1=m1
+        chain.step+=iterations
+        chain.samples=samples
+        chain.exp_d0=exp_d0
+        chain.exp_edgs=exp_edgs
+        chain.exp_max_path=exp_max_path
 
+    def array_steps(self,chain,iterations,burn_in,thin,recorder=None):
+        '''Same steps as networkx_steps with the state held in an ArrayGraph.
+        The proposed flip is applied in place and undone if MH rejects it'''
+        unique_graphs=chain.unique_graphs
+        exp_d0=chain.exp_d0
+        exp_edgs=chain.exp_edgs
+        exp_max_path=chain.exp_max_path
+        samples=chain.samples
+        G=chain.G
+        m1=chain.m1
+        moves=chain.moves
+        prof=self.profile
+        clock=timeit.default_timer
+        for i in range(chain.step,chain.step+iterations):
+            if prof is not None:
+                t0=clock()
+            A=self.draw_pair(m1.bridges,moves,indexed=True)
+            if prof is not None:
+                t1=clock()
+                prof.add('proposal',t1-t0)
+            G.flip(A[0],A[1])
+            if prof is not None:
+                t0=clock()
+                prof.add('flip',t0-t1)
+            m2=self.state_metrics(G)
+            if prof is not None:
+                t1=clock()
+                prof.add('metrics',t1-t0)
+            if self.MH(G,G,m1,m2)==1:
+                m1=m2
+                if moves is not None:
+                    self.move_set(m1.bridges,moves,indexed=True)
+            else:
+                G.undo()
+            if prof is not None:
+                t0=clock()
+                prof.add('mh',t0-t1)
 
-    def quantiling(self,dictionary):
+            if i<burn_in or (i-burn_in)%thin:
+                continue
+            exp_d0+=m1.degree
+            exp_edgs+=G.number_of_edges()
+            exp_max_path+=m1.max_path
+            samples+=1
+            self.graph_count(G,unique_graphs)
+            if recorder is not None:
+                recorder(G,m1)
+            if prof is not None:
+                prof.add('statistics',clock()-t0)
+
+        chain.m1=m1
+        chain.step+=iterations
+        chain.samples=samples
+        chain.exp_d0=exp_d0
+        chain.exp_edgs=exp_edgs
+        chain.exp_max_path=exp_max_path
+
+    def batched_steps(self,batch,iterations,burn_in,thin,recorder=None):
+        '''Lockstep steps of the chains of a BatchedChains. Every step proposes one move per chain and accepts
+        or rejects all of them at once. recorder, if given, is called as recorder(batch,observables) on every kept step'''
+        prof=self.profile
+        clock=timeit.default_timer
+        for i in range(batch.step,batch.step+iterations):
+            if prof is not None:
+                t0=clock()
+            I,J=batch.draw_pairs(prof)
+            if prof is not None:
+                t1=clock()
+                prof.add('proposal',t1-t0)
+            proposal=batch.propose(I,J)
+            if prof is not None:
+                t0=clock()
+                prof.add('metrics',t0-t1)
+            accepted=batch.metropolis(I,J,proposal,batch.rng.random(batch.K))
+            if prof is not None:
+                t1=clock()
+                prof.add('mh',t1-t0)
+                n=int(accepted.sum())
+                prof.count('mh_accepts',n)
+                prof.count('mh_rejects',batch.K-n)
+                prof.count('proposals',batch.K)
+
+            if i<burn_in or (i-burn_in)%thin:
+                continue
+            obs=batch.record()
+            if recorder is not None:
+                recorder(batch,obs)
+            if prof is not None:
+                prof.add('statistics',clock()-t1)
+        batch.step+=iterations
+
+    def quantiling(self,dictionary,size=None):
         '''Function to take in a dictionary of unique graphs and their occurances.
-        It returns a list of edge-list of top 1% graphs generated in the markov chain'''
+        It returns a list of edge-list of top 1% graphs generated in the markov chain.
+        size is the number of unique graphs if the dictionary only holds the most frequent ones'''
         print('The edge lists of the top 1% graphs are printed in ', self.o_file)
         f=open(self.o_file,"w")#Writing into the output file
-        desc_adj=sorted(dictionary.items(), key=itemgetter(1), reverse=True)
-        top=0.01*len(dictionary)
+        if isinstance(dictionary,SpaceSaving):
+            top=0.01*dictionary.distinct()
+            if top>dictionary.capacity:
+                print('Only the {0} graphs tracked by the sketch are written. Increase sketch_capacity'.format(dictionary.capacity))
+        else:
+            top=0.01*(len(dictionary) if size is None else size)
+        #a heap selects the top graphs without sorting all of them; the items of a SpillingCounter are
+        #streamed from its runs, so only the top graphs are held in memory
+        desc_adj=heapq.nlargest(1 if top<1 else int(round(top,0)),dictionary.items(),key=itemgetter(1))
         top_graphs=[]
         if top<1:
             print('Since there are less than 100 unique graphs, only the most likely graph will be written in the output file')
             #top_graphs.append(dictionary[0][0])
-            top_graphs.append(desc_adj[0][0])
+            top_graphs.append(self.decode_key(desc_adj[0][0]))
             f.write("%s\n"%top_graphs[0])
         else:
             i=0
-            while(i<=round(top,0)-1):
+            while(i<len(desc_adj)):
                 #top_graphs.append(dictionary[i][0])
-                top_graphs.append(desc_adj[i][0])
+                top_graphs.append(self.decode_key(desc_adj[i][0]))
                 f.write("%s\n"%top_graphs[i])
                 i+=1
         
@@ -0,0 +1,36 @@
+'''Optional per-phase timing of the chain loop. A MarkovChain with profiling switched on keeps a PhaseProfile;
+without it the chain loop only pays for one "is None" test per phase'''
+from collections import Counter
+
+
+class PhaseProfile(object):
+    '''Cumulative seconds and number of calls of every phase, and counters of events, for one or more chains'''
+
+    def __init__(self):
+        self.seconds=Counter()
+        self.calls=Counter()
+        self.events=Counter()
+
+    def add(self,phase,seconds):
+        self.seconds[phase]+=seconds
+        self.calls[phase]+=1
+
+    def count(self,event,n=1):
+        self.events[event]+=n
+
+    def merge(self,other):
+        '''Add the timings and counters of another profile, e.g. from another worker'''
+        self.seconds.update(other.seconds)
+        self.calls.update(other.calls)
+        self.events.update(other.events)
+
+    def report(self):
+        '''Table of the phases by time spent, followed by the event counters'''
+        total=sum(self.seconds.values())
+        lines=['{0:<16s} {1:>12s} {2:>8s} {3:>12s} {4:>12s}'.format('phase','seconds','share','calls','us/call')]
+        for phase,sec in self.seconds.most_common():
+            lines.append('{0:<16s} {1:12.4f} {2:7.1f}% {3:12d} {4:12.2f}'.format(
+                phase,sec,100.0*sec/total if total else 0.0,self.calls[phase],1e6*sec/max(self.calls[phase],1)))
+        for event in sorted(self.events):
+            lines.append('{0:<30s} {1:12d}'.format(event,self.events[event]))
+        return('\n'.join(lines))
@@ -0,0 +1,56 @@
+'''Random number streams of the chains. Every chain owns a numpy Generator seeded from a SeedSequence,
+so chains in different worker processes are statistically independent, and one seed reproduces a whole run'''
+import numpy as np
+
+
+def spawn_seeds(seed,k):
+    '''k independent child SeedSequences of seed (an int, a SeedSequence, or None for fresh OS entropy)'''
+    if not isinstance(seed,np.random.SeedSequence):
+        seed=np.random.SeedSequence(seed)
+    return(seed.spawn(k))
+
+
+class ChainRNG(object):
+    '''Random numbers for one chain over n vertices, pre-drawn in blocks.
+    Proposal pairs and uniforms come from two separate streams, so the sequence of pairs does not depend
+    on how many uniforms an engine consumes and engines can be compared on identical streams'''
+
+    def __init__(self,seed,n,block=4096):
+        pair_seed,uniform_seed=spawn_seeds(seed,2)
+        self.n=n
+        self.block=block
+        self.pair_gen=np.random.Generator(np.random.PCG64(pair_seed))
+        self.uniform_gen=np.random.Generator(np.random.PCG64(uniform_seed))
+        self.pairs_i=[]
+        self.pairs_j=[]
+        self.pair_pos=0
+        self.uniforms=[]
+        self.uniform_pos=0
+
+    def _draw_pairs(self):
+        i=self.pair_gen.integers(0,self.n,self.block)
+        j=self.pair_gen.integers(0,self.n-1,self.block)
+        j+=(j>=i)#j is uniform over the n-1 vertices other than i
+        self.pairs_i=i.tolist()
+        self.pairs_j=j.tolist()
+        self.pair_pos=0
+
+    def _draw_uniforms(self):
+        self.uniforms=self.uniform_gen.random(self.block).tolist()
+        self.uniform_pos=0
+
+    def pair(self):
+        '''Two distinct vertex indices drawn uniformly, like random.sample(range(n),2)'''
+        if self.pair_pos==len(self.pairs_i):
+            self._draw_pairs()
+        k=self.pair_pos
+        self.pair_pos+=1
+        return(self.pairs_i[k],self.pairs_j[k])
+
+    def uniform(self):
+        '''Uniform number in [0,1)'''
+        if self.uniform_pos==len(self.uniforms):
+            self._draw_uniforms()
+        u=self.uniforms[self.uniform_pos]
+        self.uniform_pos+=1
+        return(u)
@@ -0,0 +1,136 @@
+'''Bounded memory counts of the graphs visited by the chains, used instead of the exact unique graph dictionary
+when MarkovChain.sketch_capacity is set. SpaceSaving keeps at most capacity graph keys (Metwally et al.), so every
+count is an overestimate by at most the number of samples divided by the capacity, and any graph seen more often
+than that is guaranteed to be kept. The number of distinct graphs is estimated with a K minimum values sketch.
+Both parts merge across workers'''
+import heapq
+
+
+class SpaceSaving(object):
+    '''Approximate counts of the most frequent keys of a stream. Supports the parts of the dict interface the
+    chains and main use: update, items, values, keys, len, in and indexing'''
+
+    def __init__(self,capacity,distinct_k=256):
+        self.capacity=capacity
+        self.counts={}#key -> estimated count, never below the true count
+        self.errors={}#key -> largest possible overestimate of its count
+        self.heap=[]#(count,key) of every tracked key; an entry is stale when the key's count has grown since
+        self.n=0#length of the stream
+        self.distinct_k=distinct_k
+        self.hashes=[]#the distinct_k smallest key hashes, as a max heap of negated values
+        self.hashed=set()
+
+    def add(self,key,n=1):
+        counts=self.counts
+        self.n+=n
+        if key in counts:
+            counts[key]+=n
+            return
+        self.see(key)
+        if len(counts)<self.capacity:
+            counts[key]=n
+            self.errors[key]=0
+            heapq.heappush(self.heap,(n,key))
+            return
+        while True:#evict the key with the smallest count, refreshing stale heap entries on the way
+            c,old=heapq.heappop(self.heap)
+            if counts[old]==c:
+                break
+            heapq.heappush(self.heap,(counts[old],old))
+        del counts[old]
+        del self.errors[old]
+        counts[key]=c+n
+        self.errors[key]=c
+        heapq.heappush(self.heap,(c+n,key))
+
+    def see(self,key):
+        '''Offer key to the distinct count sketch'''
+        self.offer((hash((key,0x9e3779b9))&0x1fffffffffffffff)/float(0x2000000000000000))#uniform in [0,1)
+
+    def offer(self,h):
+        if h in self.hashed:
+            return
+        if len(self.hashes)<self.distinct_k:
+            heapq.heappush(self.hashes,-h)
+            self.hashed.add(h)
+        elif h<-self.hashes[0]:
+            self.hashed.discard(-heapq.heappushpop(self.hashes,-h))
+            self.hashed.add(h)
+
+    def distinct(self):
+        '''Estimated number of distinct keys in the stream (exact while it is below distinct_k)'''
+        if len(self.hashes)<self.distinct_k:
+            return(len(self.hashes))
+        return(int(round((self.distinct_k-1)/(-self.hashes[0]))))
+
+    def min_count(self):
+        '''Upper bound of the true count of any key that is not tracked'''
+        if len(self.counts)<self.capacity:
+            return(0)
+        return(min(self.counts.values()))
+
+    def error_bound(self):
+        '''Largest overestimate of any count: the stream length divided by the capacity'''
+        return(self.n/float(self.capacity))
+
+    def bounds(self,key):
+        '''(lower, upper) bounds of the true count of key'''
+        if key in self.counts:
+            return((self.counts[key]-self.errors[key],self.counts[key]))
+        return((0,self.min_count()))
+
+    def merge(self,other):
+        '''Add the counts of another SpaceSaving, e.g. from another worker. A key tracked by only one of the two
+        gets the other's min_count added to its count and error, so counts stay overestimates'''
+        min1,min2=self.min_count(),other.min_count()
+        counts={}
+        errors={}
+        for key in set(self.counts)|set(other.counts):
+            c1,e1=(self.counts[key],self.errors[key]) if key in self.counts else (min1,min1)
+            c2,e2=(other.counts[key],other.errors[key]) if key in other.counts else (min2,min2)
+            counts[key]=c1+c2
+            errors[key]=e1+e2
+        keep=heapq.nlargest(self.capacity,counts,key=counts.get)
+        self.counts={key:counts[key] for key in keep}
+        self.errors={key:errors[key] for key in keep}
+        self.heap=[(c,key) for key,c in self.counts.items()]
+        heapq.heapify(self.heap)
+        self.n+=other.n
+        for h in other.hashed:
+            self.offer(h)
+
+    def update(self,other):
+        '''Like Counter.update: add another SpaceSaving (merged), a mapping of counts or an iterable of keys'''
+        if isinstance(other,SpaceSaving):
+            self.merge(other)
+        elif hasattr(other,'items'):
+            for key,n in other.items():
+                self.add(key,n)
+        else:
+            for key in other:
+                self.add(key)
+
+    def top(self,k):
+        '''The k keys with the largest counts, as (key, count) pairs by decreasing count'''
+        return(heapq.nlargest(k,self.counts.items(),key=lambda kv:kv[1]))
+
+    def items(self):
+        return(self.counts.items())
+
+    def keys(self):
+        return(self.counts.keys())
+
+    def values(self):
+        return(self.counts.values())
+
+    def __len__(self):
+        return(len(self.counts))
+
+    def __contains__(self,key):
+        return(key in self.counts)
+
+    def __getitem__(self,key):
+        return(self.counts[key])
+
+    def __iter__(self):
+        return(iter(self.counts))
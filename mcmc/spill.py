@@ -0,0 +1,170 @@
+'''Exact unique graph counts that keep at most budget graph keys in memory, used instead of a Counter when
+MarkovChain.unique_budget is set. Past the budget the counts are written to disk as a run file sorted by graph key,
+and items() merges the runs and the keys still in memory in one streaming pass, so quantiling can select the top
+graphs without loading all counts. A worker's counts travel to main as the names of its run files plus the keys in
+memory, so the run files must be on a disk that main can read'''
+import heapq
+import os
+import tempfile
+from operator import itemgetter
+import numpy as np
+
+
+def run_dtype(key_bytes):
+    return(np.dtype([('key',np.uint8,(key_bytes,)),('count','<i8')]))
+
+
+class SpillingCounter(object):
+    '''Counts of the graph keys of a graph with n vertices. Supports the parts of the Counter interface the chains
+    and main use: update, items, values, keys, len, in and indexing. Indexing, in and len read the runs from disk.
+    Run files go to directory (default the system temporary directory); clear deletes them'''
+
+    def __init__(self,budget,n,directory=None,max_runs=32,block=65536):
+        self.budget=budget
+        self.key_bytes=max(1,(n*(n-1)//2+7)//8)#keys are stored as in the trace files
+        self.dtype=run_dtype(self.key_bytes)
+        self.directory=directory
+        self.max_runs=max_runs#runs are merged into one when there are more
+        self.block=block#records read or written at a time
+        self.counts={}
+        self.runs=[]#paths of the sorted run files
+        self.size=None#number of distinct keys, kept until a new key is added
+
+    def add(self,key,n=1):
+        counts=self.counts
+        if key in counts:
+            counts[key]+=n
+            return
+        counts[key]=n
+        self.size=None
+        if len(counts)>self.budget:
+            self.spill()
+
+    def spill(self):
+        '''Write the counts in memory to a new run'''
+        if self.counts:
+            self.runs.append(self.write_run(sorted(self.counts.items())))
+            self.counts={}
+        if len(self.runs)>self.max_runs:
+            self.compact()
+
+    def write_run(self,items):
+        '''Write (key, count) pairs in increasing key order to a new run file and return its path'''
+        fd,path=tempfile.mkstemp(prefix='uniques-',suffix='.run',dir=self.directory)
+        kb=self.key_bytes
+        with os.fdopen(fd,'wb') as f:
+            keys=[]
+            counts=[]
+            for key,c in items:
+                keys.append(key.to_bytes(kb,'little'))
+                counts.append(c)
+                if len(keys)>=self.block:
+                    self.write_block(f,keys,counts)
+            self.write_block(f,keys,counts)
+        return(path)
+
+    def write_block(self,f,keys,counts):
+        m=len(keys)
+        if m==0:
+            return
+        rec=np.empty(m,dtype=self.dtype)
+        rec['key']=np.frombuffer(b''.join(keys),dtype=np.uint8).reshape(m,self.key_bytes)
+        rec['count']=counts
+        f.write(rec.tobytes())
+        del keys[:]
+        del counts[:]
+
+    def read_run(self,path):
+        '''(key, count) pairs of a run file, read a block at a time'''
+        if os.path.getsize(path)==0:
+            return
+        run=np.memmap(path,dtype=self.dtype,mode='r')
+        kb=self.key_bytes
+        for start in range(0,len(run),self.block):
+            chunk=np.array(run[start:start+self.block])
+            raw=chunk['key'].tobytes()
+            for i,c in enumerate(chunk['count'].tolist()):
+                yield((int.from_bytes(raw[i*kb:(i+1)*kb],'little'),c))
+
+    def merged(self,paths,counts):
+        '''Streaming merge of the runs in paths and the mapping counts: (key, total count) by increasing key'''
+        streams=[self.read_run(p) for p in paths]
+        streams.append(iter(sorted(counts.items())))
+        key=None
+        total=0
+        for k,c in heapq.merge(*streams):
+            if k==key:
+                total+=c
+                continue
+            if key is not None:
+                yield((key,total))
+            key,total=k,c
+        if key is not None:
+            yield((key,total))
+
+    def compact(self):
+        '''Merge all runs into one'''
+        runs=self.runs
+        self.runs=[self.write_run(self.merged(runs,{}))]
+        for path in runs:
+            os.remove(path)
+
+    def update(self,other):
+        '''Like Counter.update: add another SpillingCounter (whose runs are taken over), a mapping of counts or an iterable of keys'''
+        if isinstance(other,SpillingCounter):
+            self.runs.extend(other.runs)
+            other.runs=[]
+            self.size=None
+            other=other.counts
+            if len(self.runs)>self.max_runs:
+                self.compact()
+        if hasattr(other,'items'):
+            for key,n in other.items():
+                self.add(key,n)
+        else:
+            for key in other:
+                self.add(key)
+
+    def items(self):
+        return(self.merged(self.runs,self.counts))
+
+    def keys(self):
+        return((key for key,c in self.items()))
+
+    def values(self):
+        return((c for key,c in self.items()))
+
+    def top(self,k):
+        '''The k keys with the largest counts, as (key, count) pairs by decreasing count'''
+        return(heapq.nlargest(k,self.items(),key=itemgetter(1)))
+
+    def clear(self):
+        '''Forget all counts and delete the run files'''
+        for path in self.runs:
+            if os.path.exists(path):
+                os.remove(path)
+        self.runs=[]
+        self.counts={}
+        self.size=0
+
+    def __len__(self):
+        if self.size is None:
+            self.size=sum(1 for kv in self.items())
+        return(self.size)
+
+    def __contains__(self,key):
+        return(self[key]>0)
+
+    def __getitem__(self,key):
+        n=self.counts.get(key,0)
+        for path in self.runs:
+            for k,c in self.read_run(path):
+                if k==key:
+                    n+=c
+                    break
+                if k>key:
+                    break
+        return(n)
+
+    def __iter__(self):
+        return(self.keys())
@@ -0,0 +1,186 @@
+'''Parameter sweeps on one warm worker pool. Every parameter set of a sweep is split into chain segments, as main
+splits a run among its workers, and the segments of all parameter sets are scheduled together so that the pool
+stays busy. Finished segments are cached on disk, keyed by a hash of the nodes, T, r, the engine and the other
+settings that change the chain, the iterations and the seed, so a repeated or extended sweep only runs new work.
+
+    m=MarkovChain()
+    m.input_arg('./IOFiles/input.txt')
+    with Sweep(m,cache_dir='./sweep-cache') as sweep:
+        for res in sweep.run(grid(T=[0.5,1,2],r=[0.5,1],seed=[1])):
+            print(res.params,res.exp_edgs)
+'''
+import hashlib
+import itertools
+import os
+import pickle
+from collections import Counter,namedtuple
+from multiprocessing import Pool
+import numpy as np
+try:
+    from .mcmc import MarkovChain
+    from .rng import spawn_seeds
+    from .sketch import SpaceSaving
+    from .spill import SpillingCounter
+except ImportError:#run as a script through mcmc/__init__.py
+    from mcmc import MarkovChain
+    from rng import spawn_seeds
+    from sketch import SpaceSaving
+    from spill import SpillingCounter
+
+RESULT_PARAMS=('engine','proposal','burn_in','thin','batch_chains','sketch_capacity','distance_storage')#settings that change the chains
+
+#Result of one parameter set: the overrides it was run with, the expected values as in main, the merged unique graph
+#counts, the number of kept samples, the number of segments taken from the cache and the key of the parameter set,
+#which names its subdirectory of checkpoint_dir and trace_dir
+SweepResult=namedtuple('SweepResult',('params','exp_d0','exp_max_path','exp_edgs','uniques','samples','cached','key'))
+
+_sweep_chains={}#MarkovChains of a worker process by spec key, so that a parameter set's distances are computed once
+
+
+def grid(**axes):
+    '''All combinations of the given values, as a list of parameter dicts: grid(T=[1,2],r=[1]) -> [{'T':1,'r':1},{'T':2,'r':1}]'''
+    names=sorted(axes)
+    return([dict(zip(names,values)) for values in itertools.product(*(axes[n] for n in names))])
+
+
+def sweep_task(job):
+    '''Pool job: (parameter set index, spec key, ChainSpec, chain number, iterations, seed).
+    Returns the parameter set index, the chain number, the chain's results and its number of kept samples'''
+    i,key,spec,k,iterations,seed=job
+    m=_sweep_chains.get(key)
+    if m is None:
+        if len(_sweep_chains)>=16:
+            _sweep_chains.clear()
+        m=_sweep_chains[key]=MarkovChain.from_spec(spec)
+    k,result,profile=m.chain_task((k,(iterations,seed)))
+    return(i,k,result,m.task_samples(iterations))
+
+
+class Sweep(object):
+    '''Runs parameter sets over the nodes and settings of base (a MarkovChain whose input is loaded) on a pool of
+    processes workers (default process_num of base) that lives until close. Each parameter set is split into
+    segments chains (default the number of workers). cache_dir, if given, keeps the results of finished segments'''
+
+    def __init__(self,base,processes=None,segments=None,cache_dir=None):
+        self.base=base
+        self.spec=base.spec()
+        self.processes=processes or base.process_num
+        self.segments=segments or self.processes
+        self.cache_dir=cache_dir
+        if cache_dir is not None:
+            if base.unique_budget is not None:
+                print ("The cache cannot hold counts spilled to temporary files. Unset unique_budget or cache_dir")
+                raise ValueError
+            os.makedirs(cache_dir,exist_ok=True)
+        self.pool=Pool(processes=self.processes)
+
+    def __enter__(self):
+        return(self)
+
+    def __exit__(self,*exc):
+        self.close()
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
+
+    def point_spec(self,params):
+        '''ChainSpec of base with the overrides in params. 'nodes' replaces the node list'''
+        spec=self.spec
+        settings=dict(spec.params)
+        for name,value in params.items():
+            if name not in ('nodes','T','r'):
+                settings[name]=value
+        if 'nodes' in params:
+            spec=spec._replace(points=np.array(params['nodes'],dtype=float),distances=None)
+        return(spec._replace(T=float(params.get('T',spec.T)),r=float(params.get('r',spec.r)),params=tuple(sorted(settings.items()))))
+
+    def point_key(self,spec,iterations,seed):
+        '''Key of a parameter set: a hash of its ChainSpec, its iterations per segment and its seed'''
+        return(hashlib.sha1(pickle.dumps((spec,self.segments,iterations,seed),2)).hexdigest())
+
+    def point_dirs(self,spec,key):
+        '''spec with checkpoint_dir and trace_dir, where set, moved to their subdirectory key. The chains of every
+        parameter set are numbered from 0, so they would otherwise overwrite each other's checkpoints and traces'''
+        settings=dict(spec.params)
+        for name in ('checkpoint_dir','trace_dir'):
+            if settings.get(name) is not None:
+                settings[name]=os.path.join(settings[name],key)
+        return(spec._replace(params=tuple(sorted(settings.items()))))
+
+    def segment_key(self,spec,k,iterations,seed):
+        '''Cache key of segment k of a parameter set, None if the run is not seeded'''
+        if seed is None:
+            return(None)
+        settings=dict(spec.params)
+        ident=(spec.points.shape,spec.points.tobytes(),spec.T,spec.r,tuple(settings.get(p) for p in RESULT_PARAMS),
+               self.segments,k,iterations,seed)
+        return(hashlib.sha1(pickle.dumps(ident,2)).hexdigest())
+
+    def cache_path(self,key):
+        return(os.path.join(self.cache_dir,key+'.pkl'))
+
+    def load(self,key):
+        if self.cache_dir is None or key is None or not os.path.exists(self.cache_path(key)):
+            return(None)
+        with open(self.cache_path(key),'rb') as f:
+            return(pickle.load(f))
+
+    def save(self,key,entry):
+        if self.cache_dir is None or key is None:
+            return
+        tmp=self.cache_path(key)+'.tmp'
+        with open(tmp,'wb') as f:
+            pickle.dump(entry,f,pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp,self.cache_path(key))#a crash never leaves a partial entry
+
+    def run(self,points):
+        '''Run every parameter set of points (dicts of MarkovChain settings such as T, r, iterations, seed, engine
+        or nodes) and return a SweepResult for each, in order'''
+        jobs=[]
+        segments=[]#per parameter set: [key, (sums, uniques, samples) or None, cached] per segment
+        for i,params in enumerate(points):
+            spec=self.point_spec(params)
+            iterations=int(params.get('iterations',self.base.iterations))
+            seed=params.get('seed',self.base.seed)
+            seeds=spawn_seeds(seed,self.segments)
+            per_chain=int(iterations/self.segments)
+            point=self.point_key(spec,per_chain,seed)
+            spec=self.point_dirs(spec,point)
+            spec_key=hashlib.sha1(pickle.dumps(spec,2)).hexdigest()
+            entries=[]
+            for k in range(self.segments):
+                key=self.segment_key(spec,k,per_chain,seed)
+                entry=self.load(key)
+                entries.append([key,entry,entry is not None])
+                if entry is None:
+                    jobs.append((i,spec_key,spec,k,per_chain,seeds[k]))
+            segments.append((point,entries))
+        #the segments of all parameter sets share the pool, one job at a time per worker
+        for i,k,result,samples in self.pool.imap_unordered(sweep_task,jobs,chunksize=1):
+            entry=(tuple(result[:3]),result[3],samples)
+            segments[i][1][k][1]=entry
+            self.save(segments[i][1][k][0],entry)
+        return([self.merge(params,point,entries) for params,(point,entries) in zip(points,segments)])
+
+    def merge(self,params,point,entries):
+        '''SweepResult of the segments of one parameter set, added in segment order'''
+        sums=[0,0,0]
+        capacity=params.get('sketch_capacity',self.base.sketch_capacity)
+        if capacity is not None:
+            uniques=SpaceSaving(capacity)
+        elif self.base.unique_budget is not None:
+            uniques=SpillingCounter(self.base.unique_budget,len(self.base.M),self.base.spill_dir)
+        else:
+            uniques=Counter()
+        samples=0
+        for key,(seg_sums,seg_uniques,seg_samples),cached in entries:
+            for j in range(3):
+                sums[j]+=seg_sums[j]
+            uniques.update(seg_uniques)
+            samples+=seg_samples
+        if samples==0:
+            print ("No samples are kept for the parameters {0}. Increase iterations".format(params))
+            raise ValueError
+        return(SweepResult(params,float(sums[0])/samples,float(sums[1])/samples,float(sums[2])/samples,uniques,samples,
+                           sum(1 for e in entries if e[2]),point))
@@ -0,0 +1,125 @@
+'''Binary traces of the kept samples of the chains. Each chain started by MarkovChain.mc_chain_generator with trace_dir
+set writes trace-<chain number>.bin. The file has a short header followed by fixed size records of the graph key
+(bit pair_index(i,j,N) of the key is bit j%8 of byte j//8), theta, the degree of vertex 0, the number of edges
+and the maximum shortest path. Trace maps a file with NumPy so that new observables can be computed over all
+samples without loading them into Python objects'''
+import glob
+import json
+import os
+import struct
+import numpy as np
+try:
+    from .distances import pair_index
+except ImportError:#run as a script through mcmc/__init__.py
+    from distances import pair_index
+
+MAGIC=b'MCMCTRC1'
+
+
+def record_dtype(key_bytes):
+    return(np.dtype([('key',np.uint8,(key_bytes,)),('theta','<f8'),('degree','<i4'),('edges','<i4'),('max_path','<f8')]))
+
+
+class TraceWriter(object):
+    '''Appends records to a trace file of a graph with n vertices. Records are collected in lists and
+    written as one block of buffer_size records'''
+
+    def __init__(self,path,n,buffer_size=8192):
+        self.n=n
+        self.key_bytes=max(1,(n*(n-1)//2+7)//8)
+        self.dtype=record_dtype(self.key_bytes)
+        self.buffer_size=buffer_size
+        self.f=open(path,'wb')
+        header=json.dumps({'n':n,'key_bytes':self.key_bytes}).encode()
+        header+=b' '*(-(len(MAGIC)+4+len(header))%8)#records start on an 8 byte boundary
+        self.f.write(MAGIC+struct.pack('<I',len(header))+header)
+        self.keys=[]
+        self.theta=[]
+        self.degree=[]
+        self.edges=[]
+        self.max_path=[]
+
+    def append(self,key,theta,degree,edges,max_path):
+        self.keys.append(key.to_bytes(self.key_bytes,'little'))
+        self.theta.append(theta)
+        self.degree.append(degree)
+        self.edges.append(edges)
+        self.max_path.append(max_path)
+        if len(self.keys)>=self.buffer_size:
+            self.flush()
+
+    def extend(self,keys,theta,degree,edges,max_path):
+        '''Append several records, one per entry of each argument'''
+        self.keys.extend(key.to_bytes(self.key_bytes,'little') for key in keys)
+        self.theta.extend(theta)
+        self.degree.extend(degree)
+        self.edges.extend(edges)
+        self.max_path.extend(max_path)
+        if len(self.keys)>=self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        m=len(self.keys)
+        if m==0:
+            return
+        rec=np.empty(m,dtype=self.dtype)
+        rec['key']=np.frombuffer(b''.join(self.keys),dtype=np.uint8).reshape(m,self.key_bytes)
+        rec['theta']=self.theta
+        rec['degree']=self.degree
+        rec['edges']=self.edges
+        rec['max_path']=self.max_path
+        self.f.write(rec.tobytes())
+        for buf in (self.keys,self.theta,self.degree,self.edges,self.max_path):
+            del buf[:]
+
+    def close(self):
+        self.flush()
+        self.f.close()
+
+
+class Trace(object):
+    '''Read only memory map of a trace file. trace['theta'] etc. are arrays over the samples'''
+
+    def __init__(self,path):
+        self.path=path
+        with open(path,'rb') as f:
+            if f.read(len(MAGIC))!=MAGIC:
+                print ("{0} is not a trace file".format(path))
+                raise IOError
+            size=struct.unpack('<I',f.read(4))[0]
+            header=json.loads(f.read(size).decode())
+        self.n=header['n']
+        self.dtype=record_dtype(header['key_bytes'])
+        offset=len(MAGIC)+4+size
+        count=(os.path.getsize(path)-offset)//self.dtype.itemsize#a partly written last record is left out
+        if count:
+            self.records=np.memmap(path,dtype=self.dtype,mode='r',offset=offset,shape=(count,))
+        else:
+            self.records=np.zeros(0,dtype=self.dtype)
+
+    def __len__(self):
+        return(len(self.records))
+
+    def __getitem__(self,field):
+        return(self.records[field])
+
+    def has_edge(self,i,j):
+        '''Boolean array: whether (i,j) is an edge of each sample'''
+        bit=pair_index(i,j,self.n)
+        return((self.records['key'][:,bit//8]&(1<<(bit%8)))!=0)
+
+    def edge_matrix(self,start=0,stop=None):
+        '''Boolean array (samples, N(N-1)/2) of the edges of the samples start..stop, columns in pair_index order'''
+        keys=np.asarray(self.records['key'][start:stop])
+        return(np.unpackbits(keys,axis=1,bitorder='little')[:,:self.n*(self.n-1)//2].astype(bool))
+
+    def key(self,i):
+        '''Graph key (int) of sample i, as used in the unique graph counts'''
+        return(int.from_bytes(self.records['key'][i].tobytes(),'little'))
+
+
+def read_traces(directory):
+    '''Traces of all chains in directory, by chain number'''
+    paths=glob.glob(os.path.join(directory,'trace-*.bin'))
+    paths.sort(key=lambda p:int(os.path.basename(p)[6:-4]))
+    return([Trace(p) for p in paths])
@@ -11,11 +11,11 @@ with open('HISTORY.rst') as history_file:
 
 requirements = [
     'Click>=6.0',
-    # TODO: put package requirements here
+    'numpy>=1.17',  # np.random.Generator and unpackbits(bitorder=...)
+    'networkx<2.0',  # the networkx engine indexes G.nodes() as a list
 ]
 
 test_requirements = [
-    'graphviz',
     'networkx',
     'numpy',
     'joblib'
@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_batched
+----------------------------------
+
+Tests for `mcmc.batched` module.
+"""
+
+import math
+import os
+import shutil
+import tempfile
+import unittest
+import networkx as nx
+import numpy as np
+from mcmc import mcmc
+from mcmc.batched import BatchedChains
+from mcmc.distances import CondensedDistances,pairwise_distances
+from mcmc.graphstate import find_bridges
+
+
+class TestBatchedChains(unittest.TestCase):
+
+    def setUp(self):
+        pts=np.random.RandomState(0).random_sample((8,2))*10
+        self.W=pairwise_distances(pts)
+        self.batch=BatchedChains(self.W,6,1.0,1.0,np.random.default_rng(1))
+
+    def graph(self,k):
+        G=nx.Graph()
+        G.add_nodes_from(range(self.batch.n))
+        for i,j in zip(*np.nonzero(np.triu(self.batch.A[k]))):
+            G.add_edge(int(i),int(j),weight=self.W[i,j])
+        return(G)
+
+    #After any number of lockstep moves the maintained paths, bridges and theta of every chain match networkx
+    def test_state_matches_networkx(self):
+        b=self.batch
+        for step in range(400):
+            i,j=b.draw_pairs()
+            b.metropolis(i,j,b.propose(i,j),b.rng.random(b.K))
+            if step%50:
+                continue
+            for k in range(b.K):
+                G=self.graph(k)
+                P=nx.single_source_dijkstra_path_length(G,0,weight='weight')
+                self.assertTrue(np.allclose([P[v] for v in range(b.n)],b.dist[k]))
+                bridges={frozenset((int(u),int(v))) for u,v in zip(*np.nonzero(np.triu(b.B[k])))}
+                self.assertEqual(bridges,find_bridges(G.adj))
+                self.assertAlmostEqual(b.theta[k],G.size(weight='weight')+sum(P.values()))
+                self.assertEqual(b.n_edges[k],G.number_of_edges())
+
+    def test_record(self):
+        self.batch.record()
+        self.assertEqual(self.batch.samples,6)
+        self.assertEqual(sum(self.batch.unique_graphs.values()),6)
+        self.assertTrue(np.all(self.batch.observables()[:,1]==7))#the star has N-1 edges
+
+    def test_dense(self):
+        C=CondensedDistances([(0,0),(3,4),(6,8)],dtype=np.float64)
+        self.assertTrue(np.allclose(C.dense(),pairwise_distances([(0,0),(3,4),(6,8)])))
+
+
+class TestBatchedEngine(unittest.TestCase):
+
+    def setUp(self):
+        self.m=mcmc.MarkovChain()
+        self.m.engine='batched'
+
+    #test_MH.txt has 3 nodes and 4 connected graphs, sampled with probability proportional to exp(-theta/T)
+    def test_stationary_distribution(self):
+        self.m.input_arg('./tests/test_MH.txt')
+        self.m.batch_chains=20
+        iterations=1000
+        exp_d0,exp_max_path,exp_edgs,uniques=self.m.mc_chain_generator(iterations,seed=3)
+        samples=sum(uniques.values())
+        self.assertEqual(samples,20*iterations)
+        self.assertEqual(len(uniques),4)
+        weights={}
+        for key in uniques:
+            weights[key]=math.exp(-self.m.theta_func(self.m.graph_from_key(key,'networkx'))/self.m.T)
+        Z=sum(weights.values())
+        for key in weights:
+            self.assertAlmostEqual(uniques[key]/float(samples),weights[key]/Z,delta=0.02)
+
+    #Every chain of the batch takes all the iterations of the task
+    def test_task_samples(self):
+        self.m.batch_chains=4
+        self.assertEqual(self.m.task_samples(103),412)
+        self.m.burn_in=5
+        self.assertEqual(self.m.task_samples(103),392)
+
+    #With the shipped input, main gives the exact expectations up to the bias of the star graph start,
+    #which the array engine shares (it is 1.2 for the degree of vertex 0 if the chains only take 1/K of the steps)
+    def test_main_matches_exact(self):
+        directory=tempfile.mkdtemp()
+        expected={}
+        try:
+            for engine in ('exact','batched'):
+                m=mcmc.MarkovChain()
+                m.overrides={'engine':engine,'seed':1,'o_file':os.path.join(directory,'output.txt')}
+                m.main()
+                expected[engine]=(m.exp_d0,m.exp_edgs,m.exp_max_path)
+        finally:
+            shutil.rmtree(directory)
+        for batched,exact in zip(expected['batched'],expected['exact']):
+            self.assertAlmostEqual(batched,exact,delta=0.25)
+
+    #Above batched_max_nodes main falls back to the array engine
+    def test_size_limit(self):
+        m=mcmc.MarkovChain()
+        m.input_f='./tests/test_input.txt'
+        m.overrides={'engine':'batched','batched_max_nodes':5,'process_num':2,'o_file':os.path.join(tempfile.mkdtemp(),'output.txt')}
+        m.main()
+        self.assertEqual(sum(m.uniques.values()),m.iterations)#one sample per step, so the array engine ran
+        self.assertEqual(m.engine,'batched')
+        shutil.rmtree(os.path.dirname(m.o_file))
+
+
+if __name__ == '__main__':
+    unittest.main()
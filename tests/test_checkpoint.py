@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_checkpoint
+----------------------------------
+
+Tests for `mcmc.checkpoint` module.
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+from mcmc import mcmc
+from mcmc.checkpoint import Checkpointer
+
+
+class TestCheckpoint(unittest.TestCase):
+
+    def setUp(self):
+        self.dir=tempfile.mkdtemp()
+        self.m=mcmc.MarkovChain()
+        self.m.input_arg('./tests/test_input.txt')
+        self.m.checkpoint_dir=self.dir
+        self.m.checkpoint_every=0#checkpoint after every block of steps
+        self.m.checkpoint_steps=40
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    #Counts appended after the last snapshot are dropped on load
+    def test_log_truncated_to_snapshot(self):
+        ckpt=Checkpointer(self.dir,0)
+        ckpt.record(5)
+        ckpt.save({'step':1})
+        ckpt.record(5)
+        ckpt.record(6)
+        with open(ckpt.log,'ab') as f:
+            f.write(b'partial record')
+        state=Checkpointer(self.dir,0).load()
+        self.assertEqual(state['step'],1)
+        self.assertEqual(state['unique_graphs'],{5:1})
+        self.assertEqual(os.path.getsize(ckpt.log),state['log_offset'])
+
+    #A chain stopped halfway and resumed from its checkpoint ends like the uninterrupted chain
+    def test_resume(self):
+        for engine,proposal in (('networkx','rejection'),('array','rejection'),('networkx','direct'),('array','direct')):
+            self.m.engine=engine
+            self.m.proposal=proposal
+            self.m.resume=False
+            full=self.m.mc_chain_generator(300,seed=9)
+            self.m.checkpointed_chain(0,140,seed=9)
+            self.m.resume=True
+            resumed=self.m.checkpointed_chain(0,300,seed=None)
+            self.assertEqual(resumed[0],full[0])
+            self.assertAlmostEqual(resumed[1],full[1])
+            self.assertEqual(resumed[2],full[2])
+            self.assertEqual(resumed[3],full[3])
@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_cli
+----------------------------------
+
+Tests for `mcmc.cli` module.
+"""
+
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+from click.testing import CliRunner
+from mcmc import cli
+from mcmc import mcmc
+
+
+class TestCli(unittest.TestCase):
+
+    def test_engines(self):
+        self.assertEqual(cli.ENGINES,mcmc.MarkovChain.engines)
+
+    #--help must not import the simulation and its heavy dependencies
+    def test_help_is_light(self):
+        code='import sys; from mcmc import cli; sys.argv=["mcmc","--help"]\ntry:\n    cli.main()\nexcept SystemExit:\n    pass\nprint("mcmc.mcmc" in sys.modules, "networkx" in sys.modules)'
+        out=subprocess.check_output([sys.executable,'-c',code]).decode()
+        self.assertIn('--iterations',out)
+        self.assertTrue(out.strip().endswith('False False'))
+
+    #the array engine runs without networkx, and the printed iterations are those of the options
+    def test_array_without_networkx(self):
+        fd,output=tempfile.mkstemp()
+        os.close(fd)
+        code='import sys; from mcmc import cli; sys.argv=["mcmc","./tests/test_input.txt","-o",{0!r},"-n","300","-w","1","--engine","array"]\ntry:\n    cli.main()\nexcept SystemExit:\n    pass\nprint("networkx" in sys.modules)'.format(output)
+        try:
+            out=subprocess.check_output([sys.executable,'-c',code]).decode()
+        finally:
+            os.remove(output)
+        self.assertIn('300',out.split())
+        self.assertTrue(out.strip().endswith('False'))
+
+    def test_run(self):
+        fd,output=tempfile.mkstemp()
+        os.close(fd)
+        try:
+            result=CliRunner().invoke(cli.main,['./tests/test_input.txt','-o',output,'-n','300','-w','1','--seed','4','--engine','array','-T','2'])
+            self.assertEqual(result.exit_code,0,result.output)
+            self.assertIn('Number of processors to be used:  1',result.output)
+            self.assertGreater(os.path.getsize(output),0)
+        finally:
+            os.remove(output)
+
+    def test_bad_options(self):
+        runner=CliRunner()
+        self.assertEqual(runner.invoke(cli.main,['./tests/test_input.txt','--engine','gpu']).exit_code,2)
+        self.assertEqual(runner.invoke(cli.main,['./tests/test_input.txt','-T','0']).exit_code,2)
+        self.assertEqual(runner.invoke(cli.main,['./tests/missing.txt']).exit_code,2)
+
+
+if __name__ == '__main__':
+    unittest.main()
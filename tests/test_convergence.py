@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_convergence
+----------------------------------
+
+Tests for `mcmc.convergence` module.
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+from mcmc import mcmc
+from mcmc.convergence import ChainSummary,effective_sample_size,merge_moments,split_rhat
+
+
+def summary(X,batch=100):
+    c=ChainSummary(X.shape[1])
+    for i in range(0,len(X),batch):
+        c.add_batch(X[i:i+batch])
+    return(c)
+
+
+class TestConvergence(unittest.TestCase):
+
+    def setUp(self):
+        self.rng=np.random.RandomState(0)
+
+    def test_merge_moments(self):
+        X=self.rng.normal(size=(50,2))
+        c=summary(X,batch=7)
+        n,mean,M2=c.moments()
+        self.assertEqual(n,50)
+        np.testing.assert_allclose(mean,X.mean(axis=0))
+        np.testing.assert_allclose(M2/(n-1),X.var(axis=0,ddof=1))
+        self.assertEqual(merge_moments((0,0.0,0.0),(3,1.0,2.0)),(3,1.0,2.0))
+
+    #Chains sampling the same distribution have R-hat close to 1 and an ESS close to the number of iid samples
+    def test_iid_chains(self):
+        chains=[summary(self.rng.normal(size=(2000,2))) for i in range(4)]
+        self.assertTrue(np.all(split_rhat(chains)<1.01))
+        ess=effective_sample_size(chains)
+        self.assertTrue(np.all(ess>4000) and np.all(ess<=8000))
+
+    def test_disagreeing_chains(self):
+        chains=[summary(self.rng.normal(size=(2000,1))+shift) for shift in (0,0,3)]
+        self.assertGreater(split_rhat(chains)[0],1.5)
+
+    def test_drifting_chain(self):
+        chain=summary(np.linspace(0,10,2000).reshape(-1,1)+self.rng.normal(size=(2000,1)))
+        self.assertGreater(split_rhat([chain])[0],1.5)
+        self.assertLess(effective_sample_size([chain])[0],200)
+
+    def test_constant_observable(self):
+        chains=[summary(np.ones((300,1))) for i in range(2)]
+        self.assertEqual(split_rhat(chains)[0],1.0)
+
+
+class TestConvergenceRun(unittest.TestCase):
+
+    #A convergence run stops long before its iteration cap and averages over the samples actually drawn
+    def test_main_converges(self):
+        m=mcmc.MarkovChain()
+        m.input_f='./tests/test_convergence.txt'
+        m.overrides={'o_file':os.path.join(tempfile.mkdtemp(),'output.txt')}
+        try:
+            m.main()
+        finally:
+            shutil.rmtree(os.path.dirname(m.o_file))
+        drawn=sum(m.uniques.values())
+        self.assertLess(drawn,m.iterations)
+        self.assertTrue(np.all(m.rhat<=m.rhat_target))
+        self.assertTrue(np.all(m.ess>=m.ess_target))
+        self.assertGreater(m.exp_edgs,len(m.M)-1)
+        self.assertLessEqual(m.exp_edgs,len(m.M)*(len(m.M)-1)/2)
@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_distances
+----------------------------------
+
+Tests for `mcmc.distances` module.
+"""
+
+import os
+import pickle
+import shutil
+import tempfile
+import unittest
+from mcmc import mcmc
+from mcmc.distances import CondensedDistances,pair_index,pairwise_distances
+
+
+class TestDistances(unittest.TestCase):
+
+    def setUp(self):
+        self.m=mcmc.MarkovChain()
+        self.m.input_arg('./tests/test_input.txt')
+
+    #The precomputed matrix gives exactly the weights of the dist function
+    def test_dense_matches_dist(self):
+        D=pairwise_distances(self.m.M)
+        for i in range(len(self.m.M)):
+            for j in range(len(self.m.M)):
+                self.assertEqual(D[i,j],self.m.dist(self.m.M[i],self.m.M[j]))
+
+    def test_pair_index(self):
+        n=5
+        idx=[pair_index(i,j,n) for i in range(n) for j in range(i+1,n)]
+        self.assertEqual(idx,list(range(n*(n-1)//2)))
+        self.assertEqual(pair_index(3,1,n),pair_index(1,3,n))
+
+    def test_condensed(self):
+        D=pairwise_distances(self.m.M)
+        C=CondensedDistances(self.m.M)
+        for i in range(len(self.m.M)):
+            for j in range(len(self.m.M)):
+                self.assertAlmostEqual(C[i,j],D[i,j],places=5)
+
+    #A memory-mapped matrix is pickled as its file name and reopened by the receiving process
+    def test_memmap_pickle(self):
+        C=CondensedDistances.memmap(self.m.M)
+        try:
+            self.assertNotIn('data',C.__getstate__())
+            C2=pickle.loads(pickle.dumps(C))
+            self.assertEqual(C2[0,3],C[0,3])
+            C2.close()#a copy does not own the file
+            self.assertTrue(os.path.exists(C.path))
+        finally:
+            C.close()
+        self.assertFalse(os.path.exists(C.path))
+
+    #A run with memory-mapped distances leaves nothing in the temporary directory
+    def test_memmap_removed_after_main(self):
+        directory=tempfile.mkdtemp()
+        saved=tempfile.tempdir
+        tempfile.tempdir=directory
+        try:
+            m=mcmc.MarkovChain()
+            m.input_f='./tests/test_input.txt'
+            m.overrides={'distance_storage':'memmap','process_num':2,'o_file':os.path.join(directory,'output.txt')}
+            m.main()
+            self.assertEqual(os.listdir(directory),['output.txt'])
+            C=CondensedDistances.memmap(self.m.M)
+            del C
+            self.assertEqual(os.listdir(directory),['output.txt'])
+        finally:
+            tempfile.tempdir=saved
+            shutil.rmtree(directory)
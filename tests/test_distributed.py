@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_distributed
+----------------------------------
+
+Tests for `mcmc.distributed` module.
+"""
+
+import multiprocessing
+import os
+import threading
+import time
+import unittest
+from collections import Counter
+from multiprocessing.connection import Client
+from mcmc import mcmc
+from mcmc.distributed import Coordinator,parse_address,run_worker
+from mcmc.rng import spawn_seeds
+
+
+def dying_worker(address,authkey):
+    '''Takes a segment and exits without answering'''
+    conn=Client(address,authkey=authkey)
+    conn.recv_bytes()
+    conn.recv()
+    os._exit(0)
+
+
+def late_worker(address,authkey,delay):
+    time.sleep(delay)
+    run_worker(address,authkey)
+
+
+class FailingSetup(object):
+    '''Setup whose segments raise'''
+    def chain_task(self,task):
+        raise ZeroDivisionError('segment {0}'.format(task[0]))
+
+
+class TestDistributed(unittest.TestCase):
+
+    def setUp(self):
+        self.m=mcmc.MarkovChain()
+        self.m.input_arg('./tests/test_input.txt')
+
+    def test_parse_address(self):
+        self.assertEqual(parse_address('localhost:6000'),('localhost',6000))
+
+    #Local workers over TCP give exactly the results of the worker pool
+    def test_matches_pool(self):
+        process_iter=[200]*4
+        seeds=spawn_seeds(1,4)
+        self.m.process_num=2
+        self.m.uniques=Counter()
+        expected=self.m.run_chains(process_iter,seeds)
+        uniques=self.m.uniques
+        self.m.uniques=Counter()
+        self.m.address=('localhost',0)
+        self.m.local_workers=2
+        self.assertEqual(self.m.run_distributed(process_iter,seeds),expected)
+        self.assertEqual(self.m.uniques,uniques)
+
+    #The segment of a worker that dies is run by another worker
+    def test_reassign(self):
+        c=Coordinator(('localhost',0))
+        tasks=list(enumerate(zip([100]*3,spawn_seeds(2,3))))
+        workers=[multiprocessing.Process(target=dying_worker,args=(c.address,c.authkey)),
+                 multiprocessing.Process(target=late_worker,args=(c.address,c.authkey,0.5))]
+        for w in workers:
+            w.start()
+        try:
+            replies=list(c.run(self.m,tasks))
+        finally:
+            c.close()
+        for w in workers:
+            w.join()
+        self.assertEqual(sorted(r[0] for r in replies),[0,1,2])
+        self.assertGreaterEqual(c.reassigned,1)
+        for k,result,profile in replies:
+            self.assertEqual(result,self.m.mc_chain_generator(*tasks[k][1]))
+
+    #Connections need the authkey, and a coordinator reachable from other machines needs one given
+    def test_authkey(self):
+        with self.assertRaises(ValueError):
+            Coordinator(('0.0.0.0',0))
+        with self.assertRaises(ValueError):
+            run_worker(('localhost',1))
+        c=Coordinator(('localhost',0))
+        self.assertGreaterEqual(len(c.authkey),16)
+        accept=threading.Thread(target=c.accept_workers)
+        accept.daemon=True
+        accept.start()
+        try:
+            with self.assertRaises(multiprocessing.AuthenticationError):
+                run_worker(c.address,b'wrong key')
+        finally:
+            c.close()
+        c=Coordinator(('0.0.0.0',0),authkey=b'secret')
+        c.close()
+
+    #A segment that raises stops the run with its exception instead of killing every worker in turn
+    def test_failing_segment(self):
+        c=Coordinator(('localhost',0),timeout=30)
+        worker=multiprocessing.Process(target=run_worker,args=(c.address,c.authkey))
+        worker.start()
+        try:
+            with self.assertRaises(ZeroDivisionError):
+                list(c.run(FailingSetup(),list(enumerate(zip([100]*2,spawn_seeds(2,2))))))
+        finally:
+            c.close()
+        worker.join(10)
+        self.assertEqual(worker.exitcode,0)
+        self.assertEqual(c.reassigned,0)
+
+
+    #Replica exchange and convergence runs are local, so main refuses them with the tcp backend
+    def test_local_modes(self):
+        for overrides in ({'temperatures':[1.0,2.0]},{'convergence':True}):
+            overrides['backend']='tcp'
+            m=mcmc.MarkovChain()
+            m.input_f='./tests/test_input.txt'
+            m.overrides=overrides
+            with self.assertRaises(ValueError):
+                m.main()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_exact
+----------------------------------
+
+Tests for `mcmc.exact` module.
+"""
+
+import itertools
+import os
+import shutil
+import tempfile
+import unittest
+import networkx as nx
+import numpy as np
+from mcmc import mcmc
+from mcmc.exact import connected_graphs,exact_distribution
+
+
+class TestExact(unittest.TestCase):
+
+    def setUp(self):
+        self.m=mcmc.MarkovChain()
+        self.m.input_arg('./tests/test_exact.txt')
+
+    #Every connected graph is found with the theta of theta_func
+    def test_matches_networkx(self):
+        M=self.m.M
+        thetas={}
+        for keys,theta,degree,edges,max_path in connected_graphs(self.m.D,self.m.r,block=100):
+            thetas.update(zip(keys.tolist(),theta.tolist()))
+        pairs=list(itertools.combinations(range(len(M)),2))
+        expected={}
+        for k in range(len(M)-1,len(pairs)+1):
+            for edges in itertools.combinations(pairs,k):
+                G=nx.Graph()
+                G.add_nodes_from(M)
+                for i,j in edges:
+                    G.add_edge(M[i],M[j],weight=self.m.D[i,j])
+                if nx.is_connected(G):
+                    expected[self.m.graph_key(G)]=self.m.theta_func(G)
+        self.assertEqual(set(thetas),set(expected))
+        for key in expected:
+            self.assertAlmostEqual(thetas[key],expected[key])
+        self.assertEqual(len(thetas),728)#connected labelled graphs on 5 vertices
+
+    def test_distribution(self):
+        res=exact_distribution(self.m.D,self.m.r,self.m.T,top_fraction=0.05)
+        self.assertEqual(res.graphs,728)
+        self.assertEqual(len(res.top),36)
+        weights=[]
+        for keys,theta,degree,edges,max_path in connected_graphs(self.m.D,self.m.r):
+            weights.extend(zip(keys.tolist(),np.exp(-theta/self.m.T).tolist(),degree.tolist(),edges.tolist()))
+        Z=sum(w for key,w,d,e in weights)
+        self.assertAlmostEqual(res.exp_d0,sum(w*d for key,w,d,e in weights)/Z)
+        self.assertAlmostEqual(res.exp_edgs,sum(w*e for key,w,d,e in weights)/Z)
+        best=max(weights,key=lambda x:x[1])
+        self.assertAlmostEqual(res.top[best[0]],best[1]/Z)
+        self.assertAlmostEqual(min(res.top.values()),sorted((w for key,w,d,e in weights),reverse=True)[35]/Z)
+
+    #A long chain agrees with the exact expectations
+    def test_chain_agrees(self):
+        res=exact_distribution(self.m.D,self.m.r,self.m.T)
+        self.m.engine='array'
+        exp_d0,exp_max_path,exp_edgs,uniques=self.m.mc_chain_generator(60000,seed=4,burn_in=1000)
+        samples=float(sum(uniques.values()))
+        self.assertAlmostEqual(exp_d0/samples,res.exp_d0,delta=0.05)
+        self.assertAlmostEqual(exp_edgs/samples,res.exp_edgs,delta=0.05)
+        self.assertAlmostEqual(exp_max_path/samples,res.exp_max_path,delta=0.05)
+
+    def test_main(self):
+        self.m.input_f='./tests/test_exact.txt'
+        directory=tempfile.mkdtemp()
+        self.m.overrides={'engine':'exact','o_file':os.path.join(directory,'output.txt')}
+        try:
+            self.m.main()
+            self.assertEqual(self.m.exact_graphs,728)
+            self.assertEqual(len(self.m.uniques),7)
+            with open(self.m.o_file) as f:
+                self.assertEqual(len(f.readlines()),7)
+            self.m.exact_max_nodes=4
+            with self.assertRaises(ValueError):
+                self.m.main()
+        finally:
+            shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_graphstate
+----------------------------------
+
+Tests for `mcmc.graphstate` module.
+"""
+
+import unittest
+import numpy as np
+from mcmc.graphstate import ArrayGraph,MoveSet,edge_key,find_bridges,key_pairs
+
+
+class TestArrayGraph(unittest.TestCase):
+
+    def setUp(self):
+        pts=np.array([(0,0),(1,0),(2,0),(0,1)],dtype=float)
+        W=np.sqrt(((pts[:,None,:]-pts[None,:,:])**2).sum(axis=2))
+        self.G=ArrayGraph.star(W)
+
+    def test_star(self):
+        self.assertEqual(self.G.number_of_edges(),3)
+        self.assertEqual(self.G.degree(0),3)
+        self.assertEqual(self.G.bridge_count(),3)
+
+    def test_flip_undo(self):
+        self.G.flip(1,2)
+        self.assertTrue(self.G.has_edge(2,1))
+        self.assertEqual(self.G.bridge_count(),1)#only (0,3) is still a bridge
+        self.assertFalse(self.G.is_bridge(0,1))
+        self.G.undo()
+        self.assertFalse(self.G.has_edge(1,2))
+        self.assertEqual(self.G.number_of_edges(),3)
+
+    def test_theta(self):
+        #weights 1+2+1 plus paths 1+2+1
+        self.assertAlmostEqual(self.G.theta(1),8)
+        self.G.flip(1,2)
+        self.assertAlmostEqual(self.G.theta(1),9)
+
+
+class TestFindBridges(unittest.TestCase):
+
+    def test_cycle_with_tail(self):
+        #triangle 0-1-2 with the path 2-3-4 hanging off it
+        adj={0:{1,2},1:{0,2},2:{0,1,3},3:{2,4},4:{3}}
+        self.assertEqual(find_bridges(adj),{frozenset((2,3)),frozenset((3,4))})
+
+    def test_list_adjacency(self):
+        adj=[{1},{0,2},{1}]
+        self.assertEqual(len(find_bridges(adj)),2)
+        self.assertEqual(find_bridges([{1,2},{0,2},{0,1}]),set())
+
+
+class TestGraphKeys(unittest.TestCase):
+
+    #key_pairs gives back the edges of edge_key in bit order, for keys that span several bytes
+    def test_round_trip(self):
+        rng=np.random.RandomState(0)
+        for n in (2,5,23):
+            pairs=[(i,j) for i in range(n) for j in range(i+1,n) if rng.random_sample()<0.3]
+            key=edge_key(pairs,n)
+            self.assertEqual(sorted(key_pairs(key,n),key=lambda p:edge_key([p],n)),key_pairs(key,n))
+            self.assertEqual(set(key_pairs(key,n)),set(pairs))
+        self.assertEqual(key_pairs(0,4),[])
+
+
+class TestShortestPathTree(unittest.TestCase):
+
+    #After any sequence of flips and undos the maintained paths should match a fresh Dijkstra
+    def test_incremental_matches_dijkstra(self):
+        rng=np.random.RandomState(3)
+        pts=rng.random_sample((12,2))
+        W=np.sqrt(((pts[:,None,:]-pts[None,:,:])**2).sum(axis=2))
+        G=ArrayGraph.star(W)
+        for step in range(400):
+            i,j=rng.choice(12,2,replace=False)
+            if G.is_bridge(i,j):
+                continue
+            G.flip(i,j)
+            if rng.random_sample()<0.5:
+                G.undo()
+            dist=G.dijkstra(0)
+            np.testing.assert_allclose(G.shortest_paths(0),dist)
+            self.assertAlmostEqual(G.tree.total,dist.sum())
+            self.assertAlmostEqual(G.size(),W[G.A].sum()/2.0)
+
+
+class TestMoveSet(unittest.TestCase):
+
+    def test_excluded_moves_are_never_sampled(self):
+        moves=MoveSet(4)
+        moves.update({0,3})
+        self.assertEqual(moves.size,4)
+        drawn={moves.sample(u) for u in np.linspace(0,0.999,50)}
+        self.assertEqual(drawn,{(0,2),(0,3),(1,3),(2,3)})#pairs 0 and 3 are (0,1) and (1,2)
+        moves.update({3,5})
+        drawn={moves.sample(u) for u in np.linspace(0,0.999,50)}
+        self.assertEqual(drawn,{(0,1),(0,2),(0,3),(1,3)})
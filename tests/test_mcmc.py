@@ -9,18 +9,34 @@ Tests for `mcmc` module.
 """
 
 import math
+import pickle
 import sys
 import os
 import unittest
 import networkx as nx
+import numpy as np
 import random
+import tempfile
 from contextlib import contextmanager
 from click.testing import CliRunner
 from mcmc import mcmc
 from copy import deepcopy
 from operator import itemgetter
+from collections import Counter
+from mcmc.rng import spawn_seeds
 from multiprocessing import Pool
 import multiprocessing
+class FailingChain(mcmc.MarkovChain):
+    '''Chain whose replicas above T=1 raise, or exit at once if exit_code is set'''
+    exit_code=None
+    def advance(self,chain,iterations,burn_in=None,thin=None,recorder=None):
+        if self.T!=1:
+            if self.exit_code is not None:
+                os._exit(self.exit_code)
+            raise ZeroDivisionError('replica at T={0}'.format(self.T))
+        return(mcmc.MarkovChain.advance(self,chain,iterations,burn_in,thin,recorder))
+
+
 class TestMcmc(unittest.TestCase):
 
     def setUp(self):
@@ -90,7 +106,7 @@ class TestMcmc(unittest.TestCase):
         G1=self.m.make_init_graph()
         self.assertEqual(self.m.graph_change(0,2,G1),-1)
         #self.assertEqual(self.m.G1.number_of_edges(),self.m.G2.number_of_edges())
-        self.m.G1.clear()
+        G1.clear()
         #self.m.G2.clear()
 
 
@@ -142,6 +158,7 @@ class TestMcmc(unittest.TestCase):
         self.assertLessEqual(self.m.exp_edgs,max_edges)#number of edges should be less than or equal to M(M-1)/2 where M is the number of nodes
         self.assertGreater(self.m.exp_d0,0)#to check that at least one or more edges are connected to node 0
         self.assertLessEqual(self.m.exp_d0,nodes-1)#deg of vertex 0 should not me more than M-1
+        self.assertEqual(sum(self.m.uniques.values()),self.m.iterations)#every worker's graphs are merged
         #To check that the output file is not empty
         flag = os.path.exists(self.m.o_file)
         self.assertTrue(flag)
@@ -189,7 +206,7 @@ class TestMcmc(unittest.TestCase):
         self.assertEqual(len(uniques),2)
         self.m.graph_count(G1,uniques)
         self.assertEqual(len(uniques),2)
-        key=frozenset(G1.edges(nbunch=self.m.M))
+        key=self.m.graph_key(G1)
         self.assertEqual(uniques[key],2)
         self.m.uniques.clear()
         #self.m.G1.clear()
@@ -234,3 +251,182 @@ class TestMcmc(unittest.TestCase):
         flag = os.path.exists(self.m.o_file)
         self.assertTrue(flag)
 
+    #The array engine draws the same random numbers as the networkx engine, so with the same seed both chains visit the same graphs
+    def test_array_engine_matches_networkx(self):
+        self.m.input_arg('./tests/test_input.txt')
+        stats=[]
+        for engine in ('networkx','array'):
+            self.m.engine=engine
+            stats.append(self.m.mc_chain_generator(300,seed=7))
+        self.assertEqual(stats[0][0],stats[1][0])#degree of vertex 0
+        self.assertAlmostEqual(stats[0][1],stats[1][1])#maximum shortest path
+        self.assertEqual(stats[0][2],stats[1][2])#number of edges
+        self.assertEqual(stats[0][3],stats[1][3])#unique graphs
+
+    def test_unknown_engine(self):
+        self.assertRaises(ValueError,self.m.input_arg,'./tests/test_engine.txt')
+
+    #The cached metrics of a state should agree with the functions that compute them one at a time
+    def test_state_metrics(self):
+        self.m.input_arg('./tests/test_input.txt')
+        G1=self.m.make_init_graph()
+        G1.add_edge(self.m.M[1],self.m.M[2],weight=self.m.dist(self.m.M[1],self.m.M[2]))
+        m1=self.m.state_metrics(G1)
+        self.assertAlmostEqual(m1.theta,self.m.theta_func(G1))
+        self.assertEqual(m1.q,self.m.calculate_q(G1))
+        self.assertEqual(len(m1.bridges),self.m.calculate_bridges(G1))
+        self.assertEqual(m1.max_path,self.m.max_shortest_path(G1))
+        self.assertEqual(m1.degree,G1.degree(self.m.M[0]))
+
+    #The bitmask key of a graph decodes back to its edge list
+    def test_graph_key_roundtrip(self):
+        self.m.input_arg('./tests/test_input.txt')
+        G1=self.m.make_init_graph()
+        G2=self.m.graph_change(1,2,G1)
+        key=self.m.graph_key(G2)
+        self.assertIsInstance(key,int)
+        self.assertEqual(set(map(frozenset,self.m.decode_key(key))),set(map(frozenset,G2.edges())))
+        self.assertNotEqual(key,self.m.graph_key(G1))
+
+    #test_MH.txt has 3 nodes and 4 connected graphs. Direct proposals must sample them with probability proportional to exp(-theta/T)
+    def test_direct_proposal_stationary_distribution(self):
+        self.m.input_arg('./tests/test_MH.txt')
+        self.m.engine='array'
+        self.m.proposal='direct'
+        iterations=20000
+        exp_d0,exp_max_path,exp_edgs,uniques=self.m.mc_chain_generator(iterations,seed=11)
+        M=self.m.M
+        graphs=[[(M[0],M[1]),(M[0],M[2])],[(M[0],M[1]),(M[1],M[2])],[(M[0],M[2]),(M[1],M[2])],[(M[0],M[1]),(M[0],M[2]),(M[1],M[2])]]
+        weights={}
+        for edges in graphs:
+            G=nx.Graph()
+            G.add_nodes_from(M)
+            for u,v in edges:
+                G.add_edge(u,v,weight=self.m.dist(u,v))
+            weights[self.m.graph_key(G)]=math.exp(-self.m.theta_func(G)/self.m.T)
+        Z=sum(weights.values())
+        for key in weights:
+            self.assertAlmostEqual(uniques.get(key,0)/float(iterations),weights[key]/Z,delta=0.02)
+
+    #The replica at T=1 of a replica exchange run samples the same distribution as a single chain
+    def test_tempering_stationary_distribution(self):
+        self.m.input_arg('./tests/test_MH.txt')
+        self.m.engine='array'
+        self.m.temperatures=[1.0,4.0]
+        self.m.swap_every=10
+        self.m.uniques=Counter()
+        iterations=20000
+        sums=self.m.run_tempering(iterations,spawn_seeds(5,2))
+        self.assertEqual(len(sums),1)
+        self.assertEqual(sum(self.m.uniques.values()),iterations)
+        self.assertGreater(self.m.swap_rates[0],0)
+        weights={}
+        for key in self.m.uniques:
+            G=self.m.graph_from_key(key,'networkx')
+            weights[key]=math.exp(-self.m.theta_func(G)/self.m.T)
+        self.assertEqual(len(weights),4)
+        Z=sum(weights.values())
+        for key in weights:
+            self.assertAlmostEqual(self.m.uniques[key]/float(iterations),weights[key]/Z,delta=0.02)
+
+    def test_swap_accepted(self):
+        self.assertTrue(self.m.swap_accepted(5.0,1.0,1.0,2.0,0.99))#the colder replica gets the lower energy
+        self.assertFalse(self.m.swap_accepted(1.0,100.0,1.0,2.0,0.01))
+        self.m.T=3
+        with self.assertRaises(ValueError):
+            self.m.temperatures=[1.0,2.0]
+            self.m.run_tempering(10,spawn_seeds(1,2))
+
+    #A pool task only carries the chain number, the iterations and the seed; the spec rebuilds the same chain
+    def test_spec(self):
+        self.m.input_arg('./tests/test_input.txt')
+        self.m.engine='array'
+        self.m.burn_in=10
+        self.m.uniques=Counter({1:1})
+        spec=self.m.spec()
+        self.assertNotIn('uniques',dict(spec.params))
+        m=mcmc.MarkovChain.from_spec(pickle.loads(pickle.dumps(spec)))
+        self.assertEqual(m.M,self.m.M)
+        self.assertTrue(np.array_equal(m.D,self.m.D))
+        self.assertEqual((m.engine,m.burn_in,m.T,m.r),('array',10,self.m.T,self.m.r))
+        self.assertLess(len(pickle.dumps((3,(1000,spawn_seeds(1,4)[3])))),1000)
+        self.assertEqual(m.mc_chain_generator(200,seed=1),self.m.mc_chain_generator(200,seed=1))
+
+    #The pool returns the sums of every chain through shared memory
+    def test_run_chains_shared_sums(self):
+        self.m.input_arg('./tests/test_input.txt')
+        self.m.process_num=2
+        self.m.uniques=Counter()
+        seeds=spawn_seeds(7,3)
+        sums=self.m.run_chains([150]*3,seeds)
+        for k in range(3):
+            result=self.m.mc_chain_generator(150,seeds[k])
+            self.assertEqual(sums[k],tuple(float(x) for x in result[:3]))
+        self.assertEqual(sum(self.m.uniques.values()),450)
+
+    #The workers of a dynamic run take exactly the requested steps together, remainder included
+    def test_run_dynamic(self):
+        self.m.input_arg('./tests/test_input.txt')
+        self.m.engine='array'
+        self.m.segment_steps=64
+        self.m.uniques=Counter()
+        sums,samples=self.m.run_dynamic(1001,spawn_seeds(3,3))
+        self.assertEqual(sum(self.m.worker_steps),1001)
+        self.assertEqual(samples,1001)
+        self.assertEqual(sum(self.m.uniques.values()),1001)
+        self.assertEqual(len(sums),3)
+        self.m.burn_in=10
+        self.m.uniques=Counter()
+        sums,samples=self.m.run_dynamic(500,spawn_seeds(3,2))
+        self.assertEqual(samples,sum(self.m.kept_samples(n) for n in self.m.worker_steps))
+
+    #A worker that fails stops the run with its exception instead of leaving main waiting
+    def test_worker_failure(self):
+        self.m.input_arg('./tests/test_input.txt')
+        self.m.uniques=Counter()
+        with open(os.path.join(tempfile.gettempdir(),'not_a_directory'),'w') as f:
+            self.m.trace_dir=os.path.join(f.name,'traces')
+        try:
+            with self.assertRaises(OSError):
+                self.m.run_dynamic(200,spawn_seeds(1,2))
+        finally:
+            os.remove(f.name)
+        m=FailingChain()
+        m.input_arg('./tests/test_input.txt')
+        m.temperatures=[1.0,2.0,4.0]
+        m.uniques=Counter()
+        with self.assertRaises(ZeroDivisionError):
+            m.run_tempering(400,spawn_seeds(1,3))
+        m.exit_code=3
+        with self.assertRaises(RuntimeError):
+            m.run_tempering(400,spawn_seeds(1,3))
+
+    def test_dynamic_batched(self):
+        self.m.input_f='./tests/test_input.txt'
+        self.m.overrides={'scheduling':'dynamic','engine':'batched'}
+        with self.assertRaises(ValueError):
+            self.m.main()
+
+    def test_burn_in_thin(self):
+        self.m.input_arg('./tests/test_input.txt')
+        exp_d0,exp_max_path,exp_edgs,uniques=self.m.mc_chain_generator(400,seed=1,burn_in=100,thin=3)
+        self.assertEqual(sum(uniques.values()),100)
+        self.assertEqual(self.m.kept_samples(400,100,3),100)
+        self.assertEqual(self.m.kept_samples(100,100,3),0)
+        self.assertEqual(self.m.kept_samples(10),10)
+
+    def test_negative_burn_in(self):
+        with open('./tests/test_input.txt') as f:
+            lines=f.read()
+        fd,input_f=tempfile.mkstemp(suffix='.txt')
+        with os.fdopen(fd,'w') as f:
+            f.write(lines+'burn_in=-5\n')
+        try:
+            with self.assertRaises(ValueError):
+                self.m.input_arg(input_f)
+        finally:
+            os.remove(input_f)
+
+    #A move that lowers theta by a lot is accepted instead of overflowing math.exp
+    def test_metropolis_large_drop(self):
+        self.assertEqual(self.m.metropolis(5000.0,1.0,0.1,0.2),1)
@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_profiling
+----------------------------------
+
+Tests for `mcmc.profiling` module.
+"""
+
+import os
+import tempfile
+import unittest
+from mcmc import mcmc
+from mcmc.profiling import PhaseProfile
+
+
+class TestPhaseProfile(unittest.TestCase):
+
+    def test_merge(self):
+        a=PhaseProfile()
+        a.add('mh',0.5)
+        a.count('mh_accepts',2)
+        b=PhaseProfile()
+        b.add('mh',0.25)
+        b.add('proposal',0.1)
+        b.count('mh_accepts')
+        a.merge(b)
+        self.assertAlmostEqual(a.seconds['mh'],0.75)
+        self.assertEqual(a.calls['mh'],2)
+        self.assertEqual(a.events['mh_accepts'],3)
+        self.assertIn('proposal',a.report())
+
+    #Every step is one proposal and one accept or reject, with both single chain engines
+    def test_chain_counts(self):
+        for engine in ('networkx','array'):
+            m=mcmc.MarkovChain()
+            m.input_arg('./tests/test_input.txt')
+            m.engine=engine
+            m.profiling=True
+            k,result,profile=m.chain_task((0,(300,1)))
+            self.assertEqual(profile.calls['proposal'],300)
+            self.assertEqual(profile.events['proposals'],300)
+            self.assertNotIn('metrics_cache_hits',profile.events)
+            self.assertEqual(profile.events['mh_accepts']+profile.events['mh_rejects'],300)
+            self.assertEqual(profile.calls['statistics'],300)
+            self.assertGreater(profile.events['result_bytes'],0)
+
+    #The batched engine proposes one move per chain and step
+    def test_batched_counts(self):
+        m=mcmc.MarkovChain()
+        m.input_arg('./tests/test_input.txt')
+        m.engine='batched'
+        m.batch_chains=4
+        m.profiling=True
+        k,result,profile=m.chain_task((0,(300,1)))
+        self.assertEqual(profile.events['proposals'],1200)
+        self.assertEqual(profile.events['mh_accepts']+profile.events['mh_rejects'],1200)
+
+    def test_disabled(self):
+        m=mcmc.MarkovChain()
+        m.input_arg('./tests/test_input.txt')
+        k,result,profile=m.chain_task((0,(50,1)))
+        self.assertIsNone(profile)
+
+    def test_main_profile_file(self):
+        fd,report=tempfile.mkstemp()
+        os.close(fd)
+        with open('./tests/test_input.txt') as f:
+            lines=f.read().replace('iterations=1000','iterations=200')
+        fd,input_f=tempfile.mkstemp(suffix='.txt')
+        with os.fdopen(fd,'w') as f:
+            f.write(lines+'process_num=2\nprofile=1\nprofile_file='+report+'\n')
+        m=mcmc.MarkovChain()
+        m.input_f=input_f
+        m.overrides={'o_file':report+'.out'}
+        try:
+            m.main()
+            self.assertEqual(m.profile.calls['proposal'],200)
+            with open(report) as f:
+                self.assertIn('mh_rejects',f.read())
+        finally:
+            os.remove(report)
+            os.remove(input_f)
+            if os.path.exists(m.o_file):
+                os.remove(m.o_file)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,39 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_rng
+----------------------------------
+
+Tests for `mcmc.rng` module.
+"""
+
+import unittest
+from mcmc import mcmc
+from mcmc.rng import ChainRNG,spawn_seeds
+
+
+class TestChainRNG(unittest.TestCase):
+
+    def test_pairs(self):
+        rng=ChainRNG(1,4,block=64)
+        pairs=[rng.pair() for i in range(1000)]#crosses several blocks
+        self.assertTrue(all(i!=j and 0<=i<4 and 0<=j<4 for i,j in pairs))
+        self.assertEqual(len(set(pairs)),12)#every ordered pair shows up
+
+    def test_same_seed_same_stream(self):
+        a=ChainRNG(5,10)
+        b=ChainRNG(5,10)
+        self.assertEqual([a.pair() for i in range(10)],[b.pair() for i in range(10)])
+        self.assertEqual([a.uniform() for i in range(10)],[b.uniform() for i in range(10)])
+
+    def test_spawned_streams_differ(self):
+        s1,s2=spawn_seeds(5,2)
+        self.assertNotEqual([ChainRNG(s1,10).uniform() for i in range(5)],[ChainRNG(s2,10).uniform() for i in range(5)])
+
+    #A seeded chain is reproducible
+    def test_seeded_chain(self):
+        m=mcmc.MarkovChain()
+        m.input_arg('./tests/test_input.txt')
+        self.assertEqual(m.mc_chain_generator(200,seed=3),m.mc_chain_generator(200,seed=3))
+        self.assertNotEqual(m.mc_chain_generator(200,seed=3)[3],m.mc_chain_generator(200,seed=4)[3])
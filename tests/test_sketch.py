@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_sketch
+----------------------------------
+
+Tests for `mcmc.sketch` module.
+"""
+
+import random
+import unittest
+from collections import Counter
+from mcmc import mcmc
+from mcmc.sketch import SpaceSaving
+
+
+def zipf_stream(n,keys,seed):
+    rng=random.Random(seed)
+    weights=[1.0/(k+1) for k in range(keys)]
+    return(rng.choices(range(keys),weights,k=n))
+
+
+class TestSpaceSaving(unittest.TestCase):
+
+    def test_exact_below_capacity(self):
+        s=SpaceSaving(10)
+        s.update([1,2,2,3,3,3])
+        self.assertEqual(dict(s.items()),{1:1,2:2,3:3})
+        self.assertEqual(s.bounds(3),(3,3))
+        self.assertEqual(s.distinct(),3)
+
+    #Every tracked count is within its error of the true count, and the frequent keys are all kept
+    def test_bounds(self):
+        stream=zipf_stream(20000,2000,1)
+        exact=Counter(stream)
+        s=SpaceSaving(50)
+        s.update(stream)
+        self.assertEqual(sum(s.values()),len(stream))
+        for key in s:
+            low,high=s.bounds(key)
+            self.assertLessEqual(low,exact[key])
+            self.assertGreaterEqual(high,exact[key])
+        for key,c in exact.items():
+            if c>s.error_bound():
+                self.assertIn(key,s)
+        self.assertEqual([k for k,c in s.top(3)],[k for k,c in exact.most_common(3)])
+
+    def test_merge(self):
+        a=zipf_stream(10000,1000,2)
+        b=zipf_stream(10000,1000,3)
+        exact=Counter(a)+Counter(b)
+        s=SpaceSaving(40)
+        s.update(a)
+        t=SpaceSaving(40)
+        t.update(b)
+        s.update(t)
+        self.assertEqual(s.n,20000)
+        self.assertLessEqual(len(s),40)
+        for key in s:
+            low,high=s.bounds(key)
+            self.assertLessEqual(low,exact[key])
+            self.assertGreaterEqual(high,exact[key])
+        self.assertEqual(s.top(1)[0][0],exact.most_common(1)[0][0])
+        self.assertAlmostEqual(s.distinct(),len(exact),delta=0.25*len(exact))
+
+    def test_distinct_estimate(self):
+        s=SpaceSaving(10)
+        s.update(range(10000))
+        self.assertAlmostEqual(s.distinct(),10000,delta=2500)
+
+    #A chain with sketch_capacity keeps at most that many graphs
+    def test_chain_sketch(self):
+        m=mcmc.MarkovChain()
+        m.input_arg('./tests/test_input.txt')
+        m.sketch_capacity=5
+        uniques=m.mc_chain_generator(500,seed=1)[3]
+        self.assertIsInstance(uniques,SpaceSaving)
+        self.assertLessEqual(len(uniques),5)
+        self.assertEqual(uniques.n,500)
+        self.assertEqual(len(m.quantiling(uniques)),1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_spill
+----------------------------------
+
+Tests for `mcmc.spill` module.
+"""
+
+import os
+import pickle
+import random
+import shutil
+import tempfile
+import unittest
+from collections import Counter
+from mcmc import mcmc
+from mcmc.rng import spawn_seeds
+from mcmc.spill import SpillingCounter
+
+
+class TestSpillingCounter(unittest.TestCase):
+
+    def setUp(self):
+        self.dir=tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def stream(self,n,seed):
+        rng=random.Random(seed)
+        return([rng.getrandbits(rng.choice((3,10,70))) for i in range(n)])#keys wider than 64 bits included
+
+    #The counts are exact whatever the budget, and never more than budget keys are held in memory
+    def test_exact_counts(self):
+        keys=self.stream(5000,1)
+        s=SpillingCounter(100,12,self.dir,max_runs=4,block=64)
+        for key in keys:
+            s.add(key)
+            self.assertLessEqual(len(s.counts),100)
+        expected=Counter(keys)
+        self.assertGreater(len(os.listdir(self.dir)),0)
+        self.assertLessEqual(len(s.runs),5)
+        self.assertEqual(dict(s.items()),dict(expected))
+        self.assertEqual(len(s),len(expected))
+        self.assertEqual(sum(s.values()),5000)
+        self.assertEqual([k for k,c in s.items()],sorted(expected))
+        key=keys[0]
+        self.assertEqual(s[key],expected[key])
+        self.assertIn(key,s)
+        self.assertNotIn(-1,s)
+        self.assertEqual([c for k,c in s.top(5)],[c for k,c in expected.most_common(5)])
+        s.clear()
+        self.assertEqual(os.listdir(self.dir),[])
+        self.assertEqual(len(s),0)
+
+    #Merging takes over the runs of a pickled counter, as main does with the workers' counts
+    def test_update(self):
+        a=SpillingCounter(50,12,self.dir)
+        b=SpillingCounter(50,12,self.dir)
+        keys_a,keys_b=self.stream(1000,2),self.stream(1000,3)
+        a.update(keys_a)
+        b.update(keys_b)
+        a.update(pickle.loads(pickle.dumps(b)))
+        a.update({keys_a[0]:5})
+        expected=Counter(keys_a)+Counter(keys_b)
+        expected[keys_a[0]]+=5
+        self.assertEqual(dict(a.items()),dict(expected))
+        a.clear()
+        self.assertEqual(os.listdir(self.dir),[])
+
+    #A chain and a pool run give the same counts with and without spilling
+    def test_chains(self):
+        m=mcmc.MarkovChain()
+        m.input_arg('./tests/test_input.txt')
+        m.engine='array'
+        exact=m.mc_chain_generator(2000,seed=4)
+        m.unique_budget=20
+        m.spill_dir=self.dir
+        spilled=m.mc_chain_generator(2000,seed=4)
+        self.assertEqual(exact[:3],spilled[:3])
+        self.assertEqual(dict(spilled[3].items()),dict(exact[3]))
+        m.process_num=2
+        m.uniques=m.new_uniques()
+        m.run_chains([500,500],spawn_seeds(5,2))
+        self.assertEqual(sum(m.uniques.values()),1000)
+        self.assertGreater(len(m.uniques.runs),1)
+        top=m.quantiling(m.uniques)
+        self.assertEqual(len(top),int(round(0.01*len(m.uniques))))
+        m.uniques.clear()
+        spilled[3].clear()
+        self.assertEqual(os.listdir(self.dir),[])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_sweep
+----------------------------------
+
+Tests for `mcmc.sweep` module.
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+from collections import Counter
+from mcmc import mcmc
+from mcmc.rng import spawn_seeds
+from mcmc.sweep import Sweep,grid
+from mcmc.tracefile import read_traces
+
+
+class TestSweep(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.m=mcmc.MarkovChain()
+        cls.m.input_arg('./tests/test_input.txt')
+        cls.m.engine='array'
+        cls.dir=tempfile.mkdtemp()
+        cls.sweep=Sweep(cls.m,processes=2,segments=2,cache_dir=cls.dir)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.sweep.close()
+        shutil.rmtree(cls.dir)
+
+    def test_grid(self):
+        self.assertEqual(grid(T=[1,2],r=[3]),[{'T':1,'r':3},{'T':2,'r':3}])
+
+    #A parameter set gives the same values as the worker pool of main with the same seed
+    def test_matches_run_chains(self):
+        res=self.sweep.run([{'T':1.5,'iterations':300,'seed':5}])[0]
+        self.m.T=1.5
+        self.m.process_num=2
+        self.m.uniques=Counter()
+        sums=self.m.run_chains([150,150],spawn_seeds(5,2))
+        self.m.T=1
+        self.assertEqual(res.samples,300)
+        self.assertAlmostEqual(res.exp_edgs,sum(s[2] for s in sums)/300.0)
+        self.assertAlmostEqual(res.exp_d0,sum(s[0] for s in sums)/300.0)
+        self.assertEqual(res.uniques,self.m.uniques)
+
+    #Repeated and extended sweeps take the finished segments from the cache
+    def test_cache(self):
+        points=grid(T=[1.0,2.0],r=[0.5],iterations=[200],seed=[1])
+        first=self.sweep.run(points)
+        self.assertEqual([r.cached for r in first],[0,0])
+        again=self.sweep.run(points+[{'T':4.0,'r':0.5,'iterations':200,'seed':1}])
+        self.assertEqual([r.cached for r in again],[2,2,0])
+        for a,b in zip(first,again):
+            self.assertEqual(a[1:4],b[1:4])
+            self.assertEqual(a.uniques,b.uniques)
+        self.assertNotEqual(again[0].exp_edgs,again[1].exp_edgs)
+
+    #Every parameter set writes its traces to its own subdirectory of trace_dir
+    def test_trace_dirs(self):
+        self.m.trace_dir=os.path.join(self.dir,'traces')
+        try:
+            with Sweep(self.m,processes=2,segments=2) as sweep:
+                results=sweep.run(grid(T=[1.0,2.0],iterations=[200],seed=[1]))
+        finally:
+            del self.m.trace_dir
+        self.assertNotEqual(results[0].key,results[1].key)
+        for res in results:
+            traces=read_traces(os.path.join(self.dir,'traces',res.key))
+            self.assertEqual(sum(len(t) for t in traces),res.samples)
+
+    def test_unseeded_not_cached(self):
+        points=[{'T':3.0,'iterations':100}]
+        self.sweep.run(points)
+        self.assertEqual(self.sweep.run(points)[0].cached,0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_tracefile
+----------------------------------
+
+Tests for `mcmc.tracefile` module.
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+from collections import Counter
+import numpy as np
+from mcmc import mcmc
+from mcmc.tracefile import Trace,TraceWriter,read_traces
+
+
+class TestTrace(unittest.TestCase):
+
+    def setUp(self):
+        self.dir=tempfile.mkdtemp()
+        self.m=mcmc.MarkovChain()
+        self.m.input_arg('./tests/test_input.txt')
+        self.m.trace_dir=self.dir
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_roundtrip(self):
+        path=os.path.join(self.dir,'t.bin')
+        w=TraceWriter(path,4,buffer_size=3)
+        for k in range(10):
+            w.append(k,0.5*k,k%3,k+3,2.0*k)
+        w.close()
+        t=Trace(path)
+        self.assertEqual(len(t),10)
+        self.assertEqual([t.key(i) for i in range(10)],list(range(10)))
+        self.assertTrue(np.allclose(t['theta'],0.5*np.arange(10)))
+        self.assertEqual(list(t.has_edge(0,1)),[k%2==1 for k in range(10)])#pair (0,1) is bit 0
+        self.assertEqual(t.edge_matrix().shape,(10,6))
+
+    #The trace of a chain holds exactly its kept samples and reproduces its statistics
+    def test_chain_trace(self):
+        for engine in ('networkx','array','batched'):#the exact engine runs no chains
+            self.m.engine=engine
+            self.m.batch_chains=4
+            exp_d0,exp_max_path,exp_edgs,uniques=self.m.mc_chain_generator(400,seed=2,burn_in=40,thin=2)
+            t=read_traces(self.dir)[0]
+            self.assertEqual(len(t),sum(uniques.values()))
+            self.assertAlmostEqual(t['degree'].sum(),exp_d0)
+            self.assertAlmostEqual(t['edges'].sum(),exp_edgs)
+            self.assertAlmostEqual(t['max_path'].sum(),exp_max_path)
+            self.assertEqual(Counter(t.key(i) for i in range(len(t))),Counter(uniques))
+            self.assertEqual(list(t.edge_matrix().sum(axis=1)),list(t['edges']))
+
+    def test_not_a_trace(self):
+        path=os.path.join(self.dir,'x.bin')
+        with open(path,'wb') as f:
+            f.write(b'something else')
+        with self.assertRaises(IOError):
+            Trace(path)
+
+
+if __name__ == '__main__':
+    unittest.main()